@@ -0,0 +1 @@
+# ベンチマーク (python -m bench)
@@ -0,0 +1,170 @@
+# 給与計算・集計のベンチマーク
+#   python -m bench                       計測して結果を表示
+#   python -m bench --save                結果を基準値 (JSON) として保存
+#   python -m bench --threshold 0.2       基準値より 20% 以上遅い / メモリが多い場面があれば終了コード 1
+import argparse
+import datetime
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from payroll import calculate_daily_total, summarize_days, summarize_records_df, DailySummaryCache, PayLedger, PayEngine, PayRules, get_closing_period
+from storage import GSheetsStorage, RecordIndex
+from .fakes import MemoryConnection
+from .generate import generate_records, generate_settings
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# --- 計測する場面 ---
+# 各場面は (準備, 本体) の組。準備は計測に含めず、本体の戻り値は捨てる
+def _user_frames(data):
+    return [(uid, df) for uid, df in data['records'].groupby('user_id')]
+
+def scene_daily_total(data):
+    # 画面と同じく、索引から取り出した1日分の Record を計算する
+    index = RecordIndex(data['records'])
+    days = [index.records_on(uid, d) for uid, dates in index.days.items() for d in dates]
+    return lambda: [calculate_daily_total(recs, 1200, 1100) for recs in days]
+
+def scene_summary_cold(data):
+    frames = _user_frames(data)
+    return lambda: [summarize_days(df, uid, 1200, 1100, DailySummaryCache()) for uid, df in frames]
+
+def scene_summary_warm(data):
+    frames = _user_frames(data)
+    cache = DailySummaryCache(max_entries=10 ** 7)
+    for uid, df in frames: summarize_days(df, uid, 1200, 1100, cache)
+    return lambda: [summarize_days(df, uid, 1200, 1100, cache) for uid, df in frames]
+
+def scene_summary_bulk(data):
+    df = data['records'].assign(date_str=data['records']['user_id'] + '/' + data['records']['date_str'])
+    return lambda: summarize_records_df(df, 1200, 1100)
+
+def scene_engine(data):
+    # 週40時間・締め期間の残業の閾値を使い、利用者ごとに全期間を1回流す
+    index = RecordIndex(data['records'])
+    users = [index.records_of(uid) for uid in index.days]
+    rules = PayRules(weekly_threshold=40 * 60, period_overtime_threshold=60 * 60, mult_period_overtime=15000)
+    return lambda: [PayEngine(1200, 1100, 25, rules).run(recs) for recs in users]
+
+def scene_calendar(data):
+    # カレンダー表示の集計部分: 締め期間の合計と月内の日ごとの参照を1年分
+    cache = DailySummaryCache(max_entries=10 ** 7)
+    summaries = [summarize_days(df, uid, 1200, 1100, cache) for uid, df in _user_frames(data)]
+    year = data['end_date'].year
+    def run():
+        for summary in summaries:
+            ledger = PayLedger(summary)
+            for month in range(1, 13):
+                s_date, e_date, _ = get_closing_period(year, month, 25)
+                ledger.total(s_date, e_date)
+                for day in range(1, 29):
+                    ledger.daily.get(datetime.date(year, month, day).strftime("%Y-%m-%d"), {'pay': 0})['pay']
+    return run
+
+def scene_registry(data):
+    # 設定シートの取得からアカウント表を作り、全員のログイン判定をする
+    conn = MemoryConnection({'settings': data['settings']})
+    ids = [f"user{n}" for n in range(1, data['users'] + 1)]
+    def run():
+        users = GSheetsStorage(conn).user_registry()
+        for n, uid in enumerate(ids, start=1): users.check(uid, f"pw{n}")
+    return run
+
+def scene_record_lookup(data):
+    # 記録シートの取得・索引作成と、利用者ごとの日付・最古日の参照
+    conn = MemoryConnection({'records': data['records'], 'settings': data['settings']})
+    dates = sorted(data['records']['date_str'].unique())[-31:]
+    ids = [f"user{n}" for n in range(1, data['users'] + 1)]
+    def run():
+        storage = GSheetsStorage(conn)
+        for uid in ids:
+            storage.get_min_record_date(uid)
+            for date_str in dates: storage.get_records_by_date(uid, date_str)
+    return run
+
+SCENES = {
+    'daily_total': scene_daily_total,
+    'summary_cold': scene_summary_cold,
+    'summary_warm': scene_summary_warm,
+    'summary_bulk': scene_summary_bulk,
+    'engine': scene_engine,
+    'calendar': scene_calendar,
+    'registry': scene_registry,
+    'record_lookup': scene_record_lookup,
+}
+
+def measure(run, repeat, min_sample=0.2):
+    # 時間は repeat 回の最小値 (短い場面は1回が min_sample 秒以上になるよう繰り返した平均)、
+    # メモリは tracemalloc を有効にした別の1回で測る
+    started = time.perf_counter()
+    run()
+    loops = max(1, int(min_sample / max(time.perf_counter() - started, 1e-6)))
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        for _ in range(loops): run()
+        times.append((time.perf_counter() - started) / loops)
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': min(times), 'peak_kb': peak // 1024}
+
+def compare(results, baseline, threshold):
+    # 基準値より threshold 以上悪化した (場面, 項目, 基準, 今回) のリスト
+    worse = []
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if base is None: continue
+        for metric in ('seconds', 'peak_kb'):
+            if base[metric] > 0 and cur[metric] > base[metric] * (1 + threshold):
+                worse.append((name, metric, base[metric], cur[metric]))
+    return worse
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description="給与計算・集計のベンチマーク")
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='*', choices=sorted(SCENES), help="計測する場面 (既定: すべて)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="基準値の JSON")
+    parser.add_argument('--save', action='store_true', help="今回の結果を基準値として保存する")
+    parser.add_argument('--threshold', type=float, default=0.25, help="許容する悪化の割合")
+    args = parser.parse_args(argv)
+
+    end_date = datetime.date(2026, 3, 31)
+    params = {'users': args.users, 'years': args.years, 'seed': args.seed}
+    data = dict(params, end_date=end_date,
+                records=generate_records(args.users, args.years, args.seed, end_date),
+                settings=generate_settings(args.users, args.seed))
+    print(f"{args.users}人 x {args.years}年 / 記録 {len(data['records']):,}行")
+
+    results = {}
+    for name in args.only or list(SCENES):
+        results[name] = measure(SCENES[name](data), args.repeat)
+        print(f"  {name:<14} {results[name]['seconds'] * 1000:10.1f} ms {results[name]['peak_kb']:10,} KB")
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'results': results}, f, indent=2)
+        print(f"基準値を保存しました: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline): return 0
+
+    with open(args.baseline, encoding='utf-8') as f: baseline = json.load(f)
+    if baseline.get('params') != params:
+        print(f"基準値と条件が違うため比較しません (基準値: {baseline.get('params')})")
+        return 0
+    worse = compare(results, baseline['results'], args.threshold)
+    for name, metric, base, cur in worse:
+        print(f"悪化: {name} {metric} {base:,.3f} -> {cur:,.3f} ({cur / base - 1:+.0%})")
+    return 1 if worse else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# GSheetsConnection の代わりにメモリ上の DataFrame を読み書きする接続
+# (conn.read / conn.update / conn.create と、行単位の書き込みで使う client._select_worksheet だけを持つ)。
+# 呼び出しの回数と、やり取りした値の大きさ (CSV にしたときのバイト数の概算) を数える
+import threading
+import time
+import uuid
+import pandas as pd
+
+class MemoryWorksheet:
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+
+    def col_values(self, col):
+        df = self.conn._sheet(self.name, 'col_values')
+        # gspread と同じく空欄は ''
+        values = [df.columns[col - 1]] + ['' if pd.isna(v) else str(v) for v in df.iloc[:, col - 1]]
+        self.conn._count('col_values', sum(len(v.encode()) + 1 for v in values))
+        return values
+
+    def append_rows(self, values, value_input_option=None):
+        with self.conn.lock:
+            df = self.conn._sheet(self.name, 'append_rows')
+            self.conn._count('append_rows', _values_bytes(values))
+            self.conn.sheets[self.name] = pd.concat([df, pd.DataFrame([dict(zip(df.columns, row)) for row in values])], ignore_index=True)
+            self.conn.revision += 1
+
+    def batch_update(self, data, value_input_option=None):
+        # data: [{'range': 'B2:B4', 'values': [[...], ...]}] (1列の範囲だけを扱う)
+        with self.conn.lock:
+            df = self.conn._sheet(self.name, 'batch_update').copy()
+            self.conn._count('batch_update', sum(_values_bytes(item['values']) for item in data))
+            for item in data:
+                start = item['range'].split(':')[0]
+                letters = start.rstrip('0123456789')
+                col = 0
+                for c in letters: col = col * 26 + ord(c) - 64
+                first = int(start[len(letters):]) - 2
+                for k, row in enumerate(item['values']):
+                    df.iat[first + k, col - 1] = row[0]
+            self.conn.sheets[self.name] = df
+            self.conn.revision += 1
+
+    def delete_rows(self, row):
+        with self.conn.lock:
+            df = self.conn._sheet(self.name, 'delete_rows')
+            self.conn.sheets[self.name] = df.drop(df.index[row - 2]).reset_index(drop=True)
+            self.conn.revision += 1
+
+class MemorySpreadsheet:
+    def __init__(self, conn):
+        self.conn = conn
+        self.id = conn.id
+
+    def get_lastUpdateTime(self):
+        # 書き込みのたびに進む版 (Drive の最終更新時刻の代わり)
+        self.conn._sheet(None, 'revision')
+        return f"rev-{self.conn.revision}"
+
+class _Client:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def _select_worksheet(self, worksheet=None, **kwargs):
+        return MemoryWorksheet(self.conn, worksheet)
+
+    def _open_spreadsheet(self, **kwargs):
+        return MemorySpreadsheet(self.conn)
+
+class MemoryConnection:
+    def __init__(self, sheets, latency=0.0):
+        # sheets: ワークシート名 -> DataFrame。latency 秒だけ各呼び出しを遅らせる
+        self.sheets = {name: df.copy() for name, df in sheets.items()}
+        self.latency = latency
+        self.calls = {}
+        self.bytes = {}
+        self._sizes = {}
+        self.revision = 0
+        self.id = uuid.uuid4().hex
+        self.lock = threading.RLock()
+        self.client = _Client(self)
+
+    def _sheet(self, worksheet, call):
+        with self.lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+        if self.latency: time.sleep(self.latency)
+        return self.sheets[worksheet] if worksheet is not None else None
+
+    def _count(self, call, size):
+        with self.lock:
+            self.bytes[call] = self.bytes.get(call, 0) + size
+
+    def _frame_size(self, worksheet, df):
+        # 同じ DataFrame (書き込みがあるまで同じオブジェクト) の大きさは1回だけ見積もる
+        cached = self._sizes.get(worksheet)
+        if cached is None or cached[0] is not df:
+            cached = (df, frame_bytes(df))
+            self._sizes[worksheet] = cached
+        return cached[1]
+
+    def read(self, worksheet=None, ttl=None, **kwargs):
+        df = self._sheet(worksheet, 'read')
+        self._count('read', self._frame_size(worksheet, df))
+        return df.copy()
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        self._sheet(worksheet, 'update')
+        self._count('update', frame_bytes(data))
+        with self.lock:
+            self.sheets[worksheet] = data.reset_index(drop=True).copy()
+            self.revision += 1
+        return data
+
+    def create(self, worksheet=None, data=None, **kwargs):
+        # 新しいワークシートを作って data を書く
+        with self.lock:
+            self.calls['create'] = self.calls.get('create', 0) + 1
+        if self.latency: time.sleep(self.latency)
+        self._count('create', frame_bytes(data))
+        with self.lock:
+            self.sheets[worksheet] = data.reset_index(drop=True).copy()
+            self.revision += 1
+        return data
+
+def frame_bytes(df, sample=200):
+    # CSV にしたときのバイト数の概算 (先頭 sample 行の平均から全体を見積もる)
+    if df is None: return 0
+    head = len(','.join(map(str, df.columns)).encode()) + 1
+    if len(df) == 0: return head
+    part = df.head(sample)
+    return head + len(part.to_csv(index=False, header=False).encode()) * len(df) // len(part)
+
+def _values_bytes(values):
+    return sum(len(','.join('' if v is None else str(v) for v in row).encode()) + 1 for row in values)
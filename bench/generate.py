@@ -0,0 +1,65 @@
+# ベンチマーク用の記録・設定データを生成する (seed が同じなら毎回同じデータ)
+import datetime
+import random
+import pandas as pd
+from storage import RECORD_COLUMNS, SETTING_COLUMNS
+
+def _hm(minutes):
+    return minutes // 60, minutes % 60
+
+def _day_records(rng, user_id, date_str):
+    recs = []
+    def add(rtype, start, end, dist=0, pay=0):
+        sh, sm = _hm(start)
+        eh, em = _hm(end)
+        recs.append({'user_id': user_id, 'date_str': date_str, 'type': rtype, 'start_h': sh, 'start_m': sm, 'end_h': eh, 'end_m': em,
+                     'distance_km': dist, 'pay_amount': pay, 'duration_minutes': end - start})
+
+    # 日勤・夕勤・夜勤 (夜勤は翌9時 = 33時まで)
+    shift = rng.random()
+    if shift < 0.6: start = rng.randrange(6 * 60, 10 * 60, 15)
+    elif shift < 0.85: start = rng.randrange(13 * 60, 17 * 60, 15)
+    else: start = rng.randrange(20 * 60, 23 * 60, 15)
+    # 3割ほどは8時間を超える残業日
+    length = rng.randrange(9 * 60, 13 * 60, 15) if rng.random() < 0.3 else rng.randrange(4 * 60, 9 * 60, 15)
+    end = min(start + length, 33 * 60)
+    add('WORK', start, end)
+
+    if end - start > 6 * 60:
+        b = rng.randrange(start + 3 * 60, end - 2 * 60, 15)
+        add('BREAK', b, b + rng.choice((30, 45, 60)))
+    # 勤務と重なる運転 (後勝ちで運転時給になる区間)
+    if rng.random() < 0.4:
+        d = rng.randrange(start, end - 30, 15)
+        add('DRIVE', d, min(d + rng.randrange(30, 4 * 60, 15), 33 * 60), dist=rng.randrange(0, 400))
+    if rng.random() < 0.1: add('DRIVE_DIRECT', 0, 0, dist=rng.randrange(1, 200))
+    if rng.random() < 0.05: add('OTHER', 0, 0, pay=rng.choice((500, 1000, 3000)))
+    return recs
+
+def generate_records(users=10, years=1, seed=0, end_date=None, work_ratio=0.7):
+    # users 人分、end_date までの years 年分の記録 (records シートと同じ列)
+    rng = random.Random(seed)
+    end_date = end_date or datetime.date(2026, 3, 31)
+    start_date = end_date.replace(year=end_date.year - years) + datetime.timedelta(days=1)
+    days = [(start_date + datetime.timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end_date - start_date).days + 1)]
+    rows = []
+    for n in range(1, users + 1):
+        user_id = f"user{n}"
+        for date_str in days:
+            if rng.random() < work_ratio: rows.extend(_day_records(rng, user_id, date_str))
+    df = pd.DataFrame(rows, columns=RECORD_COLUMNS[1:])
+    df.insert(0, 'id', range(1, len(df) + 1))
+    return df
+
+def generate_settings(users=10, seed=0):
+    # common のアカウント行と利用者ごとの時給・締め日
+    rng = random.Random(seed)
+    rows = []
+    for n in range(1, users + 1):
+        rows.append({'user_id': 'common', 'key': f'user_{n}_id', 'value': f"user{n}"})
+        rows.append({'user_id': 'common', 'key': f'user_{n}_pw', 'value': f"pw{n}"})
+    for n in range(1, users + 1):
+        rows.append({'user_id': f"user{n}", 'key': 'base_wage', 'value': str(rng.randrange(1100, 1500, 10))})
+        rows.append({'user_id': f"user{n}", 'key': 'wage_drive', 'value': str(rng.randrange(1000, 1300, 10))})
+        rows.append({'user_id': f"user{n}", 'key': 'closing_day', 'value': str(rng.choice((15, 20, 25, 31)))})
+    return pd.DataFrame(rows, columns=SETTING_COLUMNS)
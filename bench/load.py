@@ -0,0 +1,258 @@
+# 同時に使われたときの負荷試験 (シフト終わりにまとめて開かれる場面)
+#   python -m bench.load                          30セッションが同時にログイン・記録の追加・カレンダーの移動・設定の保存をする
+#   python -m bench.load --sessions 60 --latency 0.3
+#   python -m bench.load --save                   結果を基準値 (JSON) として保存
+#   python -m bench.load --threshold 0.2          基準値より p95 が 20% 以上遅い操作か、消えた書き込みがあれば終了コード 1
+# 各セッションは AppTest で main.py をそのまま動かす。シートは遅延付きのメモリ上の接続 (MemoryConnection) で、
+# 全セッションが同じプロセスのキャッシュと接続を共有する (本番のサーバーと同じ)
+import argparse
+import ast
+import contextlib
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .fakes import MemoryConnection
+from .generate import generate_records, generate_settings
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'load_baseline.json')
+ACTIONS = ('open', 'login', 'add', 'calendar', 'settings')
+
+# --- AppTest を複数のスレッドから動かすための準備 ---
+# AppTest は1つのプロセスで1回ずつ動かす前提で、次の3つがスレッドをまたいで壊れる (試験側だけの問題で、本番のサーバーには無い)
+#   - 再実行のたびにスクリプトを ast.parse し直すが、CPython 3.11 の ast.parse は同時に呼ぶと失敗することがある
+#     (AST constructor recursion depth mismatch)。本番はコンパイル済みのスクリプトを使い回す
+#   - 再実行の間だけ Runtime._instance を差し替えて終わると None に戻すので、ほかのセッションの実行中に消える
+#   - 設定 global.appTest も再実行の間だけ True にして戻すので、ほかのセッションのウィジェットの値が記録されない
+@contextlib.contextmanager
+def concurrent_app_tests():
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    parse, instance, exists = ast.parse, Runtime.__dict__['instance'], Runtime.__dict__['exists']
+    parse_lock = threading.Lock()
+    last = [None]
+
+    def locked_parse(*args, **kwargs):
+        with parse_lock: return parse(*args, **kwargs)
+
+    def current(cls):
+        # 最後に差し替えられた Runtime を、None に戻された後も使い続ける
+        if cls._instance is not None: last[0] = cls._instance
+        return last[0]
+
+    def shared_instance(cls):
+        if current(cls) is None: raise RuntimeError("Runtime hasn't been created!")
+        return last[0]
+
+    app_test = config.get_option('global.appTest')
+    ast.parse = locked_parse
+    Runtime.instance = classmethod(shared_instance)
+    Runtime.exists = classmethod(lambda cls: current(cls) is not None)
+    config.set_option('global.appTest', True)
+    try:
+        yield
+    finally:
+        ast.parse = parse
+        Runtime.instance, Runtime.exists = instance, exists
+        config.set_option('global.appTest', app_test)
+
+# --- 1セッション分の操作 ---
+class Session:
+    def __init__(self, n, args):
+        from streamlit.testing.v1 import AppTest
+        self.n = n
+        self.user_id = f"user{n}"
+        self.args = args
+        self.at = AppTest.from_file(MAIN, default_timeout=args.timeout)
+        self.samples = []   # (操作, 秒)
+        self.added = 0      # 追加ボタンを押した記録の数
+        self.wage = None    # 最後に保存した基本時給
+
+    def run(self, action, view=None):
+        # AppTest はタブの選択を引き継がないので、開くタブは再実行のたびに指定する
+        if view is not None: self.at.session_state['view'] = view
+        started = time.perf_counter()
+        self.at.run()
+        self.samples.append((action, time.perf_counter() - started))
+        if self.at.exception: raise RuntimeError(f"{self.user_id} {action}: {self.at.exception[0].message}")
+
+    def button(self, label):
+        return next(b for b in self.at.button if b.label == label)
+
+    def login(self):
+        self.run('open')
+        self.at.text_input[0].input(self.user_id)
+        self.at.text_input[1].input(f"pw{self.n}")
+        self.at.button[0].click()
+        self.run('login')
+        if self.at.session_state['user_id'] != self.user_id: raise RuntimeError(f"{self.user_id} login: ログインできません")
+
+    def add_records(self):
+        # 今日の日付に1時間半ずつずらした勤務を追加する
+        for k in range(self.args.adds):
+            start = 6 * 60 + k * 90
+            for key, v in (('sh', start // 60), ('sm', start % 60), ('eh', (start + 90) // 60), ('em', (start + 90) % 60)):
+                self.at.number_input(key=key).set_value(v)
+            self.button('追加').click()
+            self.added += 1
+            self.run('add', '記録')
+
+    def page_calendar(self):
+        self.run('calendar', 'カレンダー')
+        for _ in range(self.args.pages):
+            self.button('◀').click()
+            self.run('calendar', 'カレンダー')
+        for _ in range(self.args.pages):
+            self.button('▶').click()
+            self.run('calendar', 'カレンダー')
+
+    def save_settings(self):
+        # 基本時給はセッションごとに違う値にして、最後の値がシートに残っているかを後で確かめる
+        self.run('settings', '設定')
+        self.wage = 1000 + self.n * 10
+        self.at.number_input[0].set_value(self.wage)
+        self.button('保存').click()
+        self.run('settings', '設定')
+
+    def play(self):
+        try:
+            self.login()
+            self.add_records()
+            self.page_calendar()
+            self.save_settings()
+            return None
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+
+# --- 集計 ---
+def percentile(values, q):
+    values = sorted(values)
+    if not values: return 0.0
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))]
+
+def latency_table(sessions):
+    table = {}
+    for action in ACTIONS + ('all',):
+        values = [s for sess in sessions for a, s in sess.samples if action in (a, 'all')]
+        if values:
+            table[action] = {'runs': len(values), 'p50': percentile(values, 50), 'p95': percentile(values, 95),
+                             'p99': percentile(values, 99), 'max': max(values)}
+    return table
+
+def lost_updates(conn, sessions, today):
+    # 追加した記録と保存した設定が、最後のシートに残っているか
+    from storage import PARTITION_SHEET
+    records = conn.sheets['records']
+    todays = records[records['date_str'].astype(str) == today]
+    found = todays.groupby('user_id').size().to_dict()
+    lost = {'records': 0, 'duplicated_records': 0, 'settings': 0, 'duplicated_ids': 0}
+    for sess in sessions:
+        n = found.get(sess.user_id, 0)
+        lost['records'] += max(sess.added - n, 0)
+        lost['duplicated_records'] += max(n - sess.added, 0)
+    settings = conn.sheets['settings']
+    wages = settings[settings['key'] == 'base_wage'].set_index('user_id')['value']
+    for sess in sessions:
+        if sess.wage is None: continue
+        try: saved = int(float(wages[sess.user_id]))
+        except Exception: saved = None
+        if saved != sess.wage: lost['settings'] += 1
+    ids = [int(float(v)) for name, df in conn.sheets.items() if name == 'records' or PARTITION_SHEET.fullmatch(name) for v in df['id']]
+    lost['duplicated_ids'] = len(ids) - len(set(ids))
+    return lost
+
+def compare(results, baseline, threshold):
+    # 基準値より p95 が threshold 以上悪化した (操作, 基準, 今回) のリスト
+    worse = []
+    for action, cur in results.items():
+        base = baseline.get(action)
+        if base and base['p95'] > 0 and cur['p95'] > base['p95'] * (1 + threshold):
+            worse.append((action, base['p95'], cur['p95']))
+    return worse
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.load', description="同時セッションの負荷試験")
+    parser.add_argument('--sessions', type=int, default=30, help="同時に動かすセッション (利用者) の数")
+    parser.add_argument('--users', type=int, default=None, help="シートにいる利用者の数 (既定: --sessions と同じ)")
+    parser.add_argument('--years', type=int, default=1, help="利用者ごとの過去の記録の年数")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.1, help="シートの呼び出し1回あたりの遅延 (秒)")
+    parser.add_argument('--adds', type=int, default=3, help="セッションごとに追加する記録の数")
+    parser.add_argument('--pages', type=int, default=2, help="カレンダーを前の月へ戻る回数 (同じ回数だけ進めて戻る)")
+    parser.add_argument('--full-rewrite', action='store_true', help="行単位の書き込みを使わず、シート全体を書き直す経路を試す")
+    parser.add_argument('--timeout', type=float, default=120, help="再実行1回の制限時間 (秒)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="基準値の JSON")
+    parser.add_argument('--save', action='store_true', help="今回の結果を基準値として保存する")
+    parser.add_argument('--threshold', type=float, default=0.25, help="許容する p95 の悪化の割合")
+    args = parser.parse_args(argv)
+    users = max(args.users or args.sessions, args.sessions)
+
+    # 本番と同じ Google Sheets の経路で、ディスクのスナップショットは使わない (毎回同じ条件で始める)
+    os.environ['SALARY_STORAGE'] = 'gsheets'
+    os.environ['SALARY_SNAPSHOT_DIR'] = ''
+    import streamlit as st
+
+    today = datetime.date.today()
+    conn = MemoryConnection({'records': generate_records(users, args.years, args.seed, today - datetime.timedelta(days=1)),
+                             'settings': generate_settings(users, args.seed)}, latency=args.latency)
+    if args.full_rewrite: conn.client = None
+    st.connection = lambda *a, **k: conn
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+    print(f"{args.sessions}セッション / 利用者 {users}人 x {args.years}年 / 記録 {len(conn.sheets['records']):,}行 / "
+          f"遅延 {args.latency * 1000:.0f} ms / {'シート全体の書き直し' if args.full_rewrite else '行単位の書き込み'}")
+    sessions = [Session(n, args) for n in range(1, args.sessions + 1)]
+    start = threading.Barrier(args.sessions)
+    def play(sess):
+        start.wait()
+        return sess.play()
+    started = time.perf_counter()
+    with concurrent_app_tests(), ThreadPoolExecutor(args.sessions) as pool:
+        errors = [e for e in pool.map(play, sessions) if e]
+    elapsed = time.perf_counter() - started
+
+    results = latency_table(sessions)
+    reruns = sum(len(sess.samples) for sess in sessions)
+    print(f"\n再実行の時間 (全体 {elapsed:.1f} 秒)")
+    print(f"  {'操作':<10} {'回数':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'最大':>9}")
+    for action, r in results.items():
+        print(f"  {action:<10} {r['runs']:>6} " + ' '.join(f"{r[k] * 1000:7.0f}ms" for k in ('p50', 'p95', 'p99', 'max')))
+
+    print(f"\nシートの呼び出し (再実行 {reruns} 回あたり)")
+    for call, n in sorted(conn.calls.items()):
+        print(f"  {call:<14} {n:>8,} 回 {n / max(reruns, 1):8.2f} 回 {conn.bytes.get(call, 0) / 1024:12,.0f} KB")
+    total_bytes = sum(conn.bytes.values())
+    print(f"  {'合計':<12} {sum(conn.calls.values()):>8,} 回 {sum(conn.calls.values()) / max(reruns, 1):8.2f} 回 "
+          f"{total_bytes / 1024:12,.0f} KB ({total_bytes / max(reruns, 1) / 1024:,.1f} KB / 再実行)")
+
+    lost = lost_updates(conn, sessions, today.isoformat())
+    print(f"\n消えた書き込み: 記録 {lost['records']} / 設定 {lost['settings']}   "
+          f"重複: 記録 {lost['duplicated_records']} / ID {lost['duplicated_ids']}")
+    for e in errors: print(f"エラー: {e}")
+    broken = bool(errors) or any(lost.values())
+
+    params = {k: getattr(args, k) for k in ('sessions', 'years', 'seed', 'latency', 'adds', 'pages', 'full_rewrite')}
+    params['users'] = users
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'results': results}, f, indent=2)
+        print(f"基準値を保存しました: {args.baseline}")
+        return 1 if broken else 0
+    if not os.path.exists(args.baseline): return 1 if broken else 0
+
+    with open(args.baseline, encoding='utf-8') as f: baseline = json.load(f)
+    if baseline.get('params') != params:
+        print(f"基準値と条件が違うため比較しません (基準値: {baseline.get('params')})")
+        return 1 if broken else 0
+    worse = compare(results, baseline['results'], args.threshold)
+    for action, base, cur in worse:
+        print(f"悪化: {action} p95 {base * 1000:,.0f} ms -> {cur * 1000:,.0f} ms ({cur / base - 1:+.0%})")
+    return 1 if worse or broken else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
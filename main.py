@@ -1,18 +1,19 @@
 import streamlit as st
 import datetime
-import math
 import pandas as pd
 from streamlit_gsheets import GSheetsConnection
-from decimal import Decimal, ROUND_FLOOR, getcontext
+from storage import GSheetsStorage, SQLiteStorage, UserRegistry, MANIFEST_SHEET
+from timing import RerunTimings, TimedConnection
+from snapshots import SnapshotStore
+from payroll import (calculate_driving_allowance, calculate_direct_drive_pay, calculate_daily_total,
+                     format_time, get_closing_period, PayLedger, DailySummaryCache, summarize_days,
+                     USER_SETTING_DEFAULTS, parse_user_settings)
 import calendar
 import re
+import os
 
 # --- 1. 設定と定数 ---
-getcontext().prec = 30
 PAGE_TITLE = "給料帳"
-NIGHT_START = 22 * 60
-NIGHT_END = 27 * 60
-OVERTIME_THRESHOLD = 8 * 60
 
 st.set_page_config(page_title=PAGE_TITLE, layout="centered")
 
@@ -58,187 +59,121 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- 3. データベース操作 ---
-conn = st.connection("gsheets", type=GSheetsConnection)
-
-def get_all_records_df():
-    try:
-        df = conn.read(worksheet="records", ttl=600)
-        df = df.fillna(0)
-        df['id'] = pd.to_numeric(df['id'], errors='coerce').fillna(0).astype(int)
-        if 'user_id' not in df.columns: df['user_id'] = 'default' 
-        return df
-    except Exception:
-        return pd.DataFrame(columns=['id', 'user_id', 'date_str', 'type', 'start_h', 'start_m', 'end_h', 'end_m', 'distance_km', 'pay_amount', 'duration_minutes'])
+# SALARY_STORAGE=sqlite で Google Sheets の代わりにローカルの SQLite を使う
+STORAGE_BACKEND = os.environ.get("SALARY_STORAGE", "gsheets")
+SQLITE_PATH = os.environ.get("SALARY_SQLITE_PATH", "salary.db")
+# 取得したシートを保存するディレクトリ (再起動後の最初の表示に使う)。空にすると保存しない
+SNAPSHOT_DIR = os.environ.get("SALARY_SNAPSHOT_DIR", ".snapshots")
+# SALARY_TIMING=1 で再実行ごとの処理時間を計測する (管理者タブからも切り替え可)
+TIMING_ENABLED = os.environ.get("SALARY_TIMING", "0") == "1"
+
+@st.cache_resource
+def get_timings():
+    return RerunTimings(enabled=TIMING_ENABLED)
+
+timed = get_timings().timed
+# タブの中だけの再実行 (fragment) もひとつの再実行として計測する
+timed_fragment = get_timings().rerun(lambda: {'user': st.session_state.get("user_id")})
+get_timings().begin(user=st.session_state.get("user_id"))
+
+# シート単位でキャッシュし、書き込み時は該当シートだけを破棄する
+@st.cache_data(ttl=600, show_spinner=False)
+def read_sheet(worksheet):
+    return get_storage().load_sheet(worksheet)
+
+@st.cache_resource
+def get_storage():
+    if STORAGE_BACKEND == "sqlite": return SQLiteStorage(SQLITE_PATH)
+    return GSheetsStorage(TimedConnection(st.connection("gsheets", type=GSheetsConnection), get_timings()), reader=read_sheet,
+                          snapshots=SnapshotStore(SNAPSHOT_DIR) if SNAPSHOT_DIR else None)
 
 def crud_record(action, record_data=None, record_id=None):
     with st.spinner("処理中..."):
-        df = get_all_records_df()
         if action == "save" and record_data:
-            new_id = df['id'].max() + 1 if not df.empty and 'id' in df.columns and df['id'].max() > 0 else 1
-            record_data['id'] = new_id
-            updated_df = pd.concat([df, pd.DataFrame([record_data])], ignore_index=True)
+            touched = get_storage().save_record(record_data)
         elif action == "delete" and record_id is not None:
-            updated_df = df[df['id'] != record_id] if not df.empty else df
+            touched = get_storage().delete_record(record_id)
         else:
             return
-        conn.update(worksheet="records", data=updated_df)
-        st.cache_data.clear()
+        read_sheet.clear("records")
+        get_storage().invalidate("records")
+        for uid, d_str in touched: get_daily_cache().invalidate(uid, d_str)
 
+@timed("records.by_date")
 def get_records_by_date(date_str, user_id):
-    df = get_all_records_df()
-    if df.empty: return []
-    filtered = df[(df['date_str'] == date_str) & (df['user_id'] == user_id)].copy()
-    return filtered.to_dict('records')
-
-def get_all_records_by_user(user_id):
-    df = get_all_records_df()
-    if df.empty: return []
-    filtered = df[df['user_id'] == user_id].copy()
-    return filtered.to_dict('records')
+    return get_storage().get_records_by_date(user_id, date_str)
 
 def get_min_record_date_by_user(user_id):
-    df = get_all_records_df()
-    df_user = df[df['user_id'] == user_id]
-    if df_user.empty: return datetime.date.today()
     try:
-        min_date_str = df_user['date_str'].min()
+        min_date_str = get_storage().get_min_record_date(user_id)
         return datetime.datetime.strptime(min_date_str, '%Y-%m-%d').date()
     except:
         return datetime.date.today()
 
+@st.cache_resource
+def get_daily_cache():
+    return DailySummaryCache()
+
+@timed("calc.summary")
+def get_daily_summary(df_user, user_id, base_wage, drive_wage, start_date=None, end_date=None):
+    return summarize_days(df_user, user_id, base_wage, drive_wage, get_daily_cache(), start_date, end_date)
+
+def get_pay_ledger(user_id, base_wage, drive_wage, year):
+    # その年の締め期間 (1月分は前年12月から) を含む範囲の日別集計から累積和を作り、利用者・時給・年ごとに使い回す
+    # (読み込むのはその範囲に重なる年のパーティションだけ)
+    cache = get_daily_cache()
+    key = (user_id, int(base_wage), int(drive_wage), year)
+    ledger = cache.get_ledger(key)
+    if ledger is None:
+        ledger = get_range_ledger(user_id, base_wage, drive_wage, f"{year - 1}-12-01", f"{year}-12-31")
+        cache.put_ledger(key, ledger)
+    return ledger
+
+def get_range_ledger(user_id, base_wage, drive_wage, start_date, end_date):
+    df_user = get_storage().get_records_df(user_id, start_date, end_date)
+    return PayLedger(get_daily_summary(df_user, user_id, base_wage, drive_wage))
+
+def archive_records(year):
+    with st.spinner("アーカイブ中..."):
+        moved = get_storage().archive_year(year)
+        read_sheet.clear()
+        get_storage().invalidate()
+        return moved
+
 # --- 設定関連 ---
-def load_setting(key, default_value, user_id="common"):
+def load_settings(user_id):
+    # 1回の参照で利用者の設定をまとめて数値に変換する
     try:
-        df = conn.read(worksheet="settings", ttl=3600)
-        if df.empty or 'user_id' not in df.columns: return default_value
-        df['value'] = df['value'].astype(str)
-        row = df[(df['user_id'] == user_id) & (df['key'] == key)]
-        if not row.empty: return row.iloc[0]['value']
-        if key == 'base_wage' and user_id != 'common': save_setting(key, default_value, user_id)
-        return default_value
+        raw = get_storage().load_settings(user_id)
     except:
-        return default_value
+        return dict(USER_SETTING_DEFAULTS)
+    settings = parse_user_settings(raw)
+    if 'base_wage' not in raw and user_id != 'common': save_settings(user_id, {'base_wage': settings['base_wage']})
+    return settings
 
-def save_setting(key, value, user_id="common"):
+def save_settings(user_id, values):
     with st.spinner("設定保存中..."):
-        try:
-            df = conn.read(worksheet="settings", ttl=0)
-        except:
-            df = pd.DataFrame(columns=['user_id', 'key', 'value'])
-        match_index = df[(df['user_id'] == user_id) & (df['key'] == key)].index
-        if not match_index.empty:
-            df.loc[match_index[0], 'value'] = str(value)
-        else:
-            new_row = pd.DataFrame([{'user_id': user_id, 'key': key, 'value': str(value)}])
-            df = pd.concat([df, new_row], ignore_index=True)
-        conn.update(worksheet="settings", data=df)
-        st.cache_data.clear()
+        get_storage().save_settings(user_id, values)
+        read_sheet.clear("settings")
+        get_storage().invalidate("settings")
+        if 'base_wage' in values or 'wage_drive' in values: get_daily_cache().invalidate(user_id)
 
 def update_user_id_across_sheets(old_id, new_id, new_password, auth_users):
     with st.spinner("ID移行中..."):
-        # Records update
-        df_rec = get_all_records_df()
-        if not df_rec.empty:
-            df_rec.loc[df_rec['user_id'] == old_id, 'user_id'] = new_id
-            conn.update(worksheet="records", data=df_rec)
-        
-        # Settings update
-        df_set = conn.read(worksheet="settings", ttl=0)
-        if not df_set.empty:
-            df_set.loc[df_set['user_id'] == old_id, 'user_id'] = new_id
-            # Auth update
-            for key in auth_users:
-                if key == old_id:
-                    auth_rows = df_set[df_set['value'] == old_id]
-                    for idx, row in auth_rows.iterrows():
-                        if row['key'].endswith('_id'):
-                            user_num = row['key'].split('_')[1]
-                            df_set.loc[idx, 'value'] = new_id
-                            df_set.loc[df_set['key'] == f'user_{user_num}_pw', 'value'] = new_password
-            conn.update(worksheet="settings", data=df_set)
-        st.cache_data.clear()
+        get_storage().update_user_id(old_id, new_id, new_password, with_auth=old_id in auth_users)
+        read_sheet.clear("records")
+        read_sheet.clear("settings")
+        read_sheet.clear(MANIFEST_SHEET)
+        get_storage().invalidate("records")
+        get_storage().invalidate("settings")
+        get_daily_cache().invalidate(old_id)
         return True
 
-def load_auth_users():
+def load_user_registry():
     try:
-        df = conn.read(worksheet="settings", ttl=600)
-        auth_users = {"admin": "admin"}
-        user_rows = df[df['key'].str.endswith('_id')]
-        for _, row in user_rows.iterrows():
-            user_num = row['key'].split('_')[1]
-            user_id = row['value']
-            pw_rows = df[df['key'] == f'user_{user_num}_pw']
-            if not pw_rows.empty:
-                user_pw = pw_rows.iloc[0]['value']
-                if user_id != "admin": auth_users[user_id] = user_pw
-        return auth_users
-    except: return {"admin": "admin"}
-
-def get_next_user_number(df):
-    user_rows = df[df['key'].str.endswith('_id')]
-    nums = [int(key.split('_')[1]) for key in user_rows['key'] if key.startswith('user_') and len(key.split('_')) == 3]
-    return max(nums) + 1 if nums else 1
-
-# --- 4. 計算ロジック (精度保証版) ---
-def calculate_driving_allowance(km):
-    km = int(km)
-    if km == 0: return 0
-    if km < 10: return 150
-    if km >= 340: return 3300
-    return 300 + (math.floor((km - 10) / 30) * 300)
-
-def calculate_direct_drive_pay(km):
-    return int(km) * 25
-
-def calculate_daily_total(records, base_wage, drive_wage):
-    base_wage_dec = Decimal(base_wage)
-    drive_wage_dec = Decimal(drive_wage)
-    timeline = [None] * (48 * 60)
-    fixed_pay = Decimal(0)
-    
-    sorted_records = sorted(records, key=lambda x: int(x['start_h']) * 60 + int(x['start_m']))
-    
-    for r in sorted_records:
-        try:
-            sh, sm = int(float(r['start_h'])), int(float(r['start_m']))
-            eh, em = int(float(r['end_h'])), int(float(r['end_m']))
-            dist = Decimal(r['distance_km'])
-        except: continue
-        
-        if r['type'] == 'OTHER': fixed_pay += Decimal(r['pay_amount'])
-        elif r['type'] == 'DRIVE_DIRECT': fixed_pay += Decimal(calculate_direct_drive_pay(dist))
-        elif r['type'] == 'DRIVE':
-            fixed_pay += Decimal(calculate_driving_allowance(dist))
-            for m in range(sh*60+sm, eh*60+em): timeline[m] = 'DRIVE' if m < len(timeline) else None
-        elif r['type'] == 'WORK':
-            for m in range(sh*60+sm, eh*60+em): timeline[m] = 'WORK' if m < len(timeline) else None
-        elif r['type'] == 'BREAK':
-            for m in range(sh*60+sm, eh*60+em): timeline[m] = 'BREAK' if m < len(timeline) else None
-
-    total_wage_points = Decimal(0)
-    work_mins = 0
-    
-    for i, act in enumerate(timeline):
-        if act not in ['WORK', 'DRIVE']: continue
-        
-        rate = drive_wage_dec if act == 'DRIVE' else base_wage_dec
-        mult = Decimal(1)
-        
-        is_night = (NIGHT_START <= i < NIGHT_END)
-        is_over = (work_mins >= OVERTIME_THRESHOLD)
-        
-        if is_night and is_over: mult = Decimal('1.5625')
-        elif is_night or is_over: mult = Decimal('1.25')
-            
-        total_wage_points += rate * mult
-        work_mins += 1
-    
-    final_pay = (total_wage_points / Decimal(60)).to_integral_value(rounding=ROUND_FLOOR)
-    return int(final_pay + fixed_pay), work_mins
-
-def format_time(h, m):
-    prefix = "翌" if h >= 24 else ""
-    return f"{prefix}{h-24 if h>=24 else h:02}:{m:02}"
+        return get_storage().user_registry()
+    except:
+        return UserRegistry([])
 
 # --- 5. セッション管理 ---
 def init_session():
@@ -256,19 +191,15 @@ def clear_user_settings():
             del st.session_state[key]
 
 init_session()
+# records / settings を同時に読み込んでおく (ログイン画面で読んだものをログイン後もそのまま使う)
+get_storage().load_snapshot()
 
 # ログイン成功後のロード
 if st.session_state.authenticated:
     uid = st.session_state.user_id
     if 'base_wage' not in st.session_state:
-        try:
-            st.session_state.base_wage = int(float(load_setting('base_wage', '1190', uid)))
-            st.session_state.wage_drive = int(float(load_setting('wage_drive', '1050', uid)))
-            st.session_state.closing_day = int(float(load_setting('closing_day', '31', uid)))
-        except:
-            st.session_state.base_wage = 1190
-            st.session_state.wage_drive = 1050
-            st.session_state.closing_day = 31
+        for key, value in load_settings(uid).items():
+            st.session_state[key] = value
 
 def change_month(amount):
     m = st.session_state.view_month + amount
@@ -301,21 +232,19 @@ def render_history_list(records):
     for r in records:
         c1, c2 = st.columns([0.85, 0.15])
         with c1:
-            rtype = r['type']
+            rtype = r.type
             if rtype == 'OTHER':
-                amt = int(r['pay_amount'])
+                amt = r.pay
                 tag, cls = "その他", "tag-other"
                 txt = f"<span class='{'tag-plus' if amt>=0 else 'tag-minus'}'>{'+' if amt>=0 else '-'}{abs(amt):,}</span>"
             else:
-                sh, sm = int(float(r['start_h'])), int(float(r['start_m']))
-                eh, em = int(float(r['end_h'])), int(float(r['end_m']))
-                t_str = f"{format_time(sh, sm)} ~ {format_time(eh, em)}"
+                t_str = f"{format_time(*divmod(r.start, 60))} ~ {format_time(*divmod(r.end, 60))}"
                 
                 if rtype == 'DRIVE_DIRECT':
-                    dist, pay = int(float(r['distance_km'])), int(float(r['distance_km'])) * 25
+                    dist, pay = r.km, calculate_direct_drive_pay(r.km)
                     tag, cls, txt = "直行直帰", "tag-direct", f"<span style='color:#ffddaa; font-size:10px;'>{dist}km / ¥{pay:,}</span>"
                 elif rtype == 'DRIVE':
-                    dist, pay = int(float(r['distance_km'])), calculate_driving_allowance(Decimal(r['distance_km']))
+                    dist, pay = r.km, calculate_driving_allowance(r.km)
                     tag, cls, txt = "運転", "tag-drive", f"{t_str} <span style='color:#aaffdd; font-size:10px;'>({dist}km/¥{pay:,})</span>"
                 elif rtype == 'BREAK':
                     tag, cls, txt = "休憩", "tag-break", t_str
@@ -326,29 +255,15 @@ def render_history_list(records):
         
         with c2:
             st.markdown('<div style="height: 4px;"></div>', unsafe_allow_html=True)
-            if st.button("✕", key=f"del_{r['id']}"):
-                crud_record("delete", record_id=r['id'])
+            if st.button("✕", key=f"del_{r.id}"):
+                crud_record("delete", record_id=r.id)
                 st.rerun()
 
-def render_calendar_view(summary, year, month, closing_day):
-    if closing_day == 31:
-        s_date, e_date = datetime.date(year, month, 1), datetime.date(year, month, calendar.monthrange(year, month)[1])
-        label = f"{year}年{month}月1日～{e_date.day}日 (カレンダー月)"
-    else:
-        prev_m = 12 if month == 1 else month - 1
-        prev_y = year - 1 if month == 1 else year
-        s_date = datetime.date(prev_y, prev_m, min(closing_day + 1, calendar.monthrange(prev_y, prev_m)[1]))
-        e_date = datetime.date(year, month, min(closing_day, calendar.monthrange(year, month)[1]))
-        label = f"{prev_y}年{prev_m}月{s_date.day}日～{year}年{month}月{e_date.day}日 ({closing_day}日締め)"
-
-    t_pay, t_min = 0, 0
-    curr = s_date
-    while curr <= e_date:
-        d_str = curr.strftime("%Y-%m-%d")
-        if d_str in summary:
-            t_pay += summary[d_str]['pay']
-            t_min += summary[d_str]['min']
-        curr += datetime.timedelta(days=1)
+@timed("render.calendar")
+def render_calendar_view(ledger, year, month, closing_day):
+    s_date, e_date, label = get_closing_period(year, month, closing_day)
+    summary = ledger.daily
+    t_pay, t_min = ledger.total(s_date, e_date)
 
     st.markdown(f"""<div class="total-area"><div class="total-sub">計算期間: {label}</div><div class="total-amount">¥ {t_pay:,}</div><div class="total-sub" style="margin-top:5px;">総稼働: {t_min//60}時間{t_min%60}分</div></div>""", unsafe_allow_html=True)
 
@@ -375,12 +290,12 @@ def render_calendar_view(summary, year, month, closing_day):
 # --- メインフロー ---
 def login_form():
     st.title("ログイン")
-    users = load_auth_users()
+    users = load_user_registry()
     with st.form("login"):
         uid = st.text_input("ユーザーID")
         pw = st.text_input("パスワード", type="password")
         if st.form_submit_button("ログイン"):
-            if uid in users and users[uid] == pw:
+            if users.check(uid, pw):
                 st.session_state.authenticated = True
                 st.session_state.user_id = uid
                 # ★ ログイン成功時に以前のユーザー設定が残らないようクリア
@@ -389,163 +304,202 @@ def login_form():
                 st.rerun()
             else: st.error("IDまたはパスワードが違います")
 
-if not st.session_state.authenticated:
-    login_form()
-else:
-    is_admin = st.session_state.user_id == "admin"
-    tabs = st.tabs(["記録", "カレンダー", "設定"] + (["管理者"] if is_admin else []))
+# --- TAB 1: 記録 ---
+@st.fragment
+@timed_fragment
+def record_tab():
+    st.write("")
+    # 日付選択 (上部へ)
+    input_date = st.date_input("日付", value=datetime.date.today())
+    input_date_str = input_date.strftime("%Y-%m-%d")
+    
+    st.markdown("---")
+    rec_type = st.radio("タイプ", ["勤務", "休憩", "運転", "その他"], horizontal=True, label_visibility="collapsed")
     
-    # --- TAB 1: 記録 ---
-    with tabs[0]:
-        st.write("")
-        # 日付選択 (上部へ)
-        input_date = st.date_input("日付", value=datetime.date.today())
-        input_date_str = input_date.strftime("%Y-%m-%d")
+    if rec_type == "その他":
+        st.markdown("<div style='height:15px'></div>", unsafe_allow_html=True)
+        c1, c2 = st.columns([1, 1.5])
+        kind = c1.radio("区分", ["支給 (+)", "控除 (-)"], label_visibility="collapsed")
+        amt = c2.number_input("金額 (円)", min_value=0, step=100)
+        st.markdown("<div style='height:15px'></div>", unsafe_allow_html=True)
+        if st.button("追加", type="primary", width='stretch'):
+            if amt <= 0: st.error("金額を入力してください")
+            else:
+                crud_record("save", {"user_id": st.session_state.user_id, "date_str": input_date_str, "type": "OTHER", "start_h":0, "start_m":0, "end_h":0, "end_m":0, "distance_km":0, "pay_amount": amt if "支給" in kind else -amt, "duration_minutes":0})
+                st.rerun()
+    else:
+        is_drv = rec_type == "運転"
+        is_direct = st.toggle("直行直帰 (時給なし・25円/km)", False) if is_drv else False
+        disabled = is_direct
         
-        st.markdown("---")
-        rec_type = st.radio("タイプ", ["勤務", "休憩", "運転", "その他"], horizontal=True, label_visibility="collapsed")
+        sh, sm = time_inputs_row("開始", "sh", "sm", None, None, disabled)
+        eh, em = time_inputs_row("終了", "eh", "em", None, None, disabled)
         
-        if rec_type == "その他":
-            st.markdown("<div style='height:15px'></div>", unsafe_allow_html=True)
-            c1, c2 = st.columns([1, 1.5])
-            kind = c1.radio("区分", ["支給 (+)", "控除 (-)"], label_visibility="collapsed")
-            amt = c2.number_input("金額 (円)", min_value=0, step=100)
-            st.markdown("<div style='height:15px'></div>", unsafe_allow_html=True)
-            if st.button("追加", type="primary", width='stretch'):
-                if amt <= 0: st.error("金額を入力してください")
-                else:
-                    crud_record("save", {"user_id": st.session_state.user_id, "date_str": input_date_str, "type": "OTHER", "start_h":0, "start_m":0, "end_h":0, "end_m":0, "distance_km":0, "pay_amount": amt if "支給" in kind else -amt, "duration_minutes":0})
-                    st.rerun()
-        else:
-            is_drv = rec_type == "運転"
-            is_direct = st.toggle("直行直帰 (時給なし・25円/km)", False) if is_drv else False
-            disabled = is_direct
-            
-            sh, sm = time_inputs_row("開始", "sh", "sm", None, None, disabled)
-            eh, em = time_inputs_row("終了", "eh", "em", None, None, disabled)
-            
-            dist = 0
-            if is_drv:
-                curr_km = int(st.session_state.get('d_km', 0))
-                allow = calculate_direct_drive_pay(curr_km) if is_direct else calculate_driving_allowance(curr_km)
-                label = "支給" if is_direct else "手当"
-                col = "#ffddaa" if is_direct else "#55bb88"
-                st.markdown(f"<div style='display:flex; justify-content:space-between; font-size:11px; font-weight:bold; color:{col};'><div>距離: {curr_km} km</div><div>{label}: ¥{allow:,}</div></div>", unsafe_allow_html=True)
-                dist = st.number_input("km", 0, 350, 0, 1, key="d_km", label_visibility="collapsed")
-
-            st.markdown("<div style='height:15px'></div>", unsafe_allow_html=True)
-            if st.button("追加", type="primary", width='stretch'):
-                if not disabled and (sh is None or sm is None or eh is None or em is None): st.error("時間を入力してください")
-                elif not disabled and (sh*60+sm) >= (eh*60+em): st.error("開始 < 終了 にしてください")
-                else:
-                    code = "DRIVE_DIRECT" if is_direct else "DRIVE" if is_drv else "BREAK" if rec_type == "休憩" else "WORK"
-                    s_h, s_m = (0, 0) if is_direct else (sh, sm)
-                    e_h, e_m = (0, 0) if is_direct else (eh, em)
-                    duration = 0 if is_direct else (e_h*60+e_m)-(s_h*60+s_m)
-                    
-                    crud_record("save", {"user_id": st.session_state.user_id, "date_str": input_date_str, "type": code, "start_h": s_h, "start_m": s_m, "end_h": e_h, "end_m": e_m, "distance_km": dist, "pay_amount": 0, "duration_minutes": duration})
-                    st.rerun()
-
-        # リスト表示
-        day_recs = get_records_by_date(input_date_str, st.session_state.user_id)
+        dist = 0
+        if is_drv:
+            curr_km = int(st.session_state.get('d_km', 0))
+            allow = calculate_direct_drive_pay(curr_km) if is_direct else calculate_driving_allowance(curr_km)
+            label = "支給" if is_direct else "手当"
+            col = "#ffddaa" if is_direct else "#55bb88"
+            st.markdown(f"<div style='display:flex; justify-content:space-between; font-size:11px; font-weight:bold; color:{col};'><div>距離: {curr_km} km</div><div>{label}: ¥{allow:,}</div></div>", unsafe_allow_html=True)
+            dist = st.number_input("km", 0, 350, 0, 1, key="d_km", label_visibility="collapsed")
+
+        st.markdown("<div style='height:15px'></div>", unsafe_allow_html=True)
+        if st.button("追加", type="primary", width='stretch'):
+            if not disabled and (sh is None or sm is None or eh is None or em is None): st.error("時間を入力してください")
+            elif not disabled and (sh*60+sm) >= (eh*60+em): st.error("開始 < 終了 にしてください")
+            else:
+                code = "DRIVE_DIRECT" if is_direct else "DRIVE" if is_drv else "BREAK" if rec_type == "休憩" else "WORK"
+                s_h, s_m = (0, 0) if is_direct else (sh, sm)
+                e_h, e_m = (0, 0) if is_direct else (eh, em)
+                duration = 0 if is_direct else (e_h*60+e_m)-(s_h*60+s_m)
+                
+                crud_record("save", {"user_id": st.session_state.user_id, "date_str": input_date_str, "type": code, "start_h": s_h, "start_m": s_m, "end_h": e_h, "end_m": e_m, "distance_km": dist, "pay_amount": 0, "duration_minutes": duration})
+                st.rerun()
+
+    # リスト表示
+    day_recs = get_records_by_date(input_date_str, st.session_state.user_id)
+    with get_timings().span("calc.daily_total"):
         d_pay, d_min = calculate_daily_total(day_recs, st.session_state.base_wage, st.session_state.wage_drive)
-        
-        render_history_list(day_recs)
-        
-        st.markdown(f"""<div class="total-area" style="margin-top:10px; background-color:#1f2933;"><div class="total-sub">実働 {d_min//60}時間{d_min%60}分</div><div class="total-amount">計 ¥{d_pay:,}</div></div>""", unsafe_allow_html=True)
+    
+    render_history_list(day_recs)
+    
+    st.markdown(f"""<div class="total-area" style="margin-top:10px; background-color:#1f2933;"><div class="total-sub">実働 {d_min//60}時間{d_min%60}分</div><div class="total-amount">計 ¥{d_pay:,}</div></div>""", unsafe_allow_html=True)
+
+# --- TAB 2: カレンダー ---
+@st.fragment
+@timed_fragment
+def calendar_tab():
+    v_y = st.session_state.view_year
+    v_m = st.session_state.view_month
+    
+    # ナビゲーション
+    c1, c2, c3 = st.columns([1, 3, 1])
+    min_rec = get_min_record_date_by_user(st.session_state.user_id).replace(day=1)
+    cur_d = datetime.date.today().replace(day=1)
+    view_d = datetime.date(v_y, v_m, 1)
+    
+    if c1.button("◀", width='stretch', disabled=view_d <= min_rec): change_month(-1); st.rerun()
+    c2.markdown(f"<div style='text-align:center; font-weight:bold; padding-top:5px; color:#bbb;'>{v_y}年 {v_m}月</div>", unsafe_allow_html=True)
+    if c3.button("▶", width='stretch', disabled=view_d >= cur_d): change_month(1); st.rerun()
+    
+    st.write("")
+    # 集計と描画
+    ledger = get_pay_ledger(st.session_state.user_id, st.session_state.base_wage, st.session_state.wage_drive, v_y)
+    render_calendar_view(ledger, v_y, v_m, st.session_state.closing_day)
+
+    with st.expander("集計レポート"):
+        kind = st.radio("集計", ["年間", "四半期", "期間指定"], horizontal=True, label_visibility="collapsed")
+        if kind == "期間指定":
+            r1, r2 = st.columns(2)
+            r_s = r1.date_input("開始", value=view_d)
+            r_e = r2.date_input("終了", value=datetime.date(v_y, v_m, calendar.monthrange(v_y, v_m)[1]))
+            r_ledger = get_range_ledger(st.session_state.user_id, st.session_state.base_wage, st.session_state.wage_drive, str(r_s), str(r_e))
+            rows = r_ledger.report([(r_s, r_e, f"{r_s}～{r_e}")])
+        elif kind == "四半期":
+            rows = ledger.quarterly_report(v_y, st.session_state.closing_day)
+        else:
+            rows = ledger.annual_report(v_y, st.session_state.closing_day)
+        st.dataframe(pd.DataFrame(rows), hide_index=True, width='stretch')
+
+# --- TAB 3: 設定 ---
+@st.fragment
+@timed_fragment
+def settings_tab():
+    st.write("")
+    st.subheader("設定")
+    c1, c2, c3 = st.columns(3)
+    nw = c1.number_input("基本時給", value=st.session_state.base_wage, step=10)
+    ndw = c2.number_input("運転時給", value=st.session_state.wage_drive, step=10)
+    ncd = c3.number_input("締め日", value=st.session_state.closing_day, min_value=1, max_value=31)
+    
+    if st.button("保存"):
+        st.session_state.base_wage = nw
+        st.session_state.wage_drive = ndw
+        st.session_state.closing_day = ncd
+        save_settings(st.session_state.user_id, {'base_wage': nw, 'wage_drive': ndw, 'closing_day': ncd})
+        st.success("保存しました")
+        st.rerun()
+
+    st.markdown("<br><h6>アカウント変更</h6>", unsafe_allow_html=True)
+    with st.form("act_change"):
+        nid = st.text_input("新ID", value=st.session_state.user_id)
+        npw = st.text_input("新PW", type="password")
+        cpw = st.text_input("現在のパスワード", type="password")
+        if st.form_submit_button("更新"):
+            users = load_user_registry()
+            if cpw != (users.password_of(st.session_state.user_id) or ""): st.error("現在のパスワードが違います")
+            elif not re.search(r'[a-zA-Z]', nid): st.error("IDに英字を含めてください")
+            elif npw and (not re.search(r'[a-zA-Z]', npw) or not re.search(r'\d', npw)): st.error("PWは英数混在必須です")
+            elif nid != st.session_state.user_id and nid in users: st.error("ID重複")
+            else:
+                update_user_id_across_sheets(st.session_state.user_id, nid, npw or cpw, users)
+                st.session_state.user_id = nid
+                st.success("更新しました")
+                st.rerun()
 
-    # --- TAB 2: カレンダー ---
-    with tabs[1]:
-        v_y = st.session_state.view_year
-        v_m = st.session_state.view_month
-        
-        # ナビゲーション
-        c1, c2, c3 = st.columns([1, 3, 1])
-        min_rec = get_min_record_date_by_user(st.session_state.user_id).replace(day=1)
-        cur_d = datetime.date.today().replace(day=1)
-        view_d = datetime.date(v_y, v_m, 1)
-        
-        if c1.button("◀", width='stretch', disabled=view_d <= min_rec): change_month(-1); st.rerun()
-        c2.markdown(f"<div style='text-align:center; font-weight:bold; padding-top:5px; color:#bbb;'>{v_y}年 {v_m}月</div>", unsafe_allow_html=True)
-        if c3.button("▶", width='stretch', disabled=view_d >= cur_d): change_month(1); st.rerun()
-        
-        st.write("")
-        # 集計と描画
-        all_r = get_all_records_by_user(st.session_state.user_id)
-        summary = {}
-        from itertools import groupby
-        all_r.sort(key=lambda x: x['date_str'])
-        for date, group in groupby(all_r, key=lambda x: x['date_str']):
-            p, m = calculate_daily_total(list(group), st.session_state.base_wage, st.session_state.wage_drive)
-            summary[date] = {'pay': p, 'min': m}
-            
-        render_calendar_view(summary, v_y, v_m, st.session_state.closing_day)
-
-    # --- TAB 3: 設定 ---
-    with tabs[2]:
-        st.write("")
-        st.subheader("設定")
-        c1, c2, c3 = st.columns(3)
-        nw = c1.number_input("基本時給", value=st.session_state.base_wage, step=10)
-        ndw = c2.number_input("運転時給", value=st.session_state.wage_drive, step=10)
-        ncd = c3.number_input("締め日", value=st.session_state.closing_day, min_value=1, max_value=31)
-        
-        if st.button("保存"):
-            st.session_state.base_wage = nw
-            st.session_state.wage_drive = ndw
-            st.session_state.closing_day = ncd
-            save_setting('base_wage', nw, st.session_state.user_id)
-            save_setting('wage_drive', ndw, st.session_state.user_id)
-            save_setting('closing_day', ncd, st.session_state.user_id)
-            st.success("保存しました")
-            st.rerun()
-
-        st.markdown("<br><h6>アカウント変更</h6>", unsafe_allow_html=True)
-        with st.form("act_change"):
-            nid = st.text_input("新ID", value=st.session_state.user_id)
-            npw = st.text_input("新PW", type="password")
-            cpw = st.text_input("現在のパスワード", type="password")
-            if st.form_submit_button("更新"):
-                users = load_auth_users()
-                if cpw != users.get(st.session_state.user_id, ""): st.error("現在のパスワードが違います")
-                elif not re.search(r'[a-zA-Z]', nid): st.error("IDに英字を含めてください")
-                elif npw and (not re.search(r'[a-zA-Z]', npw) or not re.search(r'\d', npw)): st.error("PWは英数混在必須です")
-                elif nid != st.session_state.user_id and nid in users: st.error("ID重複")
-                else:
-                    update_user_id_across_sheets(st.session_state.user_id, nid, npw or cpw, users)
-                    st.session_state.user_id = nid
-                    st.success("更新しました")
-                    st.rerun()
-        
-    # --- TAB 4: 管理者 ---
-    if is_admin:
-        with tabs[3]:
-            st.title("管理者")
-            st.subheader("アカウント一覧")
-            df_set = conn.read(worksheet="settings", ttl=0)
-            key_df = df_set[df_set['key'].str.endswith(('_id', '_pw'))].copy()
-            if not key_df.empty:
-                ids = key_df[key_df['key'].str.endswith('_id')]
-                pws = key_df[key_df['key'].str.endswith('_pw')]
-                disp = []
-                for _, r in ids.iterrows():
-                    u_id = r['value']
-                    pw_r = pws[pws['key'] == r['key'].replace('_id', '_pw')]
-                    u_pw = pw_r.iloc[0]['value'] if not pw_r.empty else ""
-                    disp.append({"ID": u_id, "PW": u_pw})
-                st.dataframe(pd.DataFrame(disp), use_container_width=True)
-
-            st.subheader("新規作成")
-            with st.form("create_user"):
-                new_id = st.text_input("ID")
-                new_pw = st.text_input("PW", type="password")
-                if st.form_submit_button("作成"):
-                    if not re.search(r'[a-zA-Z]', new_id): st.error("IDに英字必須")
-                    elif not re.search(r'[a-zA-Z]', new_pw) or not re.search(r'\d', new_pw): st.error("PWは英数混在")
-                    elif new_id in load_auth_users(): st.error("重複")
-                    else:
-                        n = get_next_user_number(df_set)
-                        save_setting(f'user_{n}_id', new_id)
-                        save_setting(f'user_{n}_pw', new_pw)
-                        st.success("作成完了")
-                        st.rerun()
\ No newline at end of file
+# --- TAB 4: 管理者 ---
+@st.fragment
+@timed_fragment
+def admin_tab():
+    st.title("管理者")
+    st.subheader("アカウント一覧")
+    # 設定シートの読み込みは一覧を開いたときだけ
+    if st.toggle("一覧を表示", key="show_accounts"):
+        accounts = load_user_registry().accounts()
+        if accounts:
+            st.dataframe(pd.DataFrame(accounts), use_container_width=True)
+
+    cs = get_daily_cache().stats()
+    st.caption(f"日別集計キャッシュ: {cs['entries']}件 (ヒット {cs['hits']} / ミス {cs['misses']})")
+    snapshots = getattr(get_storage(), 'snapshots', None)
+    if snapshots is not None:
+        ss = snapshots.stats()
+        st.caption(f"シートのスナップショット: ディスクから {ss['hits']}回 / 取得 {ss['misses']}回 / 保存失敗 {ss['failures']}回")
+
+    st.subheader("処理時間")
+    timings = get_timings()
+    tc1, tc2 = st.columns([3, 1])
+    timings.enabled = tc1.toggle("再実行ごとに計測する", value=timings.enabled)
+    if tc2.button("リセット", width='stretch'): timings.reset()
+    t_rows = timings.summary()
+    if t_rows:
+        st.caption(f"直近 {timings.window} 回までの再実行 (計 {timings.reruns} 回) の1回あたり")
+        st.dataframe(pd.DataFrame(t_rows), hide_index=True, width='stretch')
+    elif timings.enabled: st.caption("計測中 (次の再実行から集計されます)")
+
+    st.subheader("記録のアーカイブ")
+    # 締まった年の記録を年ごとのシートに移して records を小さく保つ
+    last_year = datetime.date.today().year - 1
+    a1, a2 = st.columns([3, 1])
+    a_year = a1.number_input("移す年", value=last_year, max_value=last_year, step=1)
+    if a2.button("移動", width='stretch'):
+        st.success(f"{a_year}年の記録を {archive_records(int(a_year))}件 移しました")
+
+    st.subheader("新規作成")
+    with st.form("create_user"):
+        new_id = st.text_input("ID")
+        new_pw = st.text_input("PW", type="password")
+        if st.form_submit_button("作成"):
+            users = load_user_registry()
+            if not re.search(r'[a-zA-Z]', new_id): st.error("IDに英字必須")
+            elif not re.search(r'[a-zA-Z]', new_pw) or not re.search(r'\d', new_pw): st.error("PWは英数混在")
+            elif new_id in users: st.error("重複")
+            else:
+                n = users.next_user_number()
+                save_settings('common', {f'user_{n}_id': new_id, f'user_{n}_pw': new_pw})
+                st.success("作成完了")
+                st.rerun()
+
+if not st.session_state.authenticated:
+    login_form()
+else:
+    is_admin = st.session_state.user_id == "admin"
+    # 選択中のタブだけを実行する (タブの中の操作はそのタブの fragment だけを再実行する)
+    labels = ["記録", "カレンダー", "設定"] + (["管理者"] if is_admin else [])
+    views = [record_tab, calendar_tab, settings_tab] + ([admin_tab] if is_admin else [])
+    for tab, view in zip(st.tabs(labels, key="view", on_change="rerun"), views):
+        if tab.open:
+            with tab: view()
+
+get_timings().end(user=st.session_state.user_id)
\ No newline at end of file
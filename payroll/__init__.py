@@ -0,0 +1,10 @@
+# 給与計算の本体 (Streamlit / pandas に依存しない)
+from .calc import (NIGHT_START, NIGHT_END, OVERTIME_THRESHOLD, DAY_MINUTES, PayRules, DEFAULT_RULES,
+                   calculate_driving_allowance, calculate_direct_drive_pay, calculate_daily_total, day_segments)
+from .records import (RECORD_TYPES, USER_SETTING_DEFAULTS, SETTING_COLUMNS, COMPACT_COLUMNS, Record, parse_user_settings, format_time,
+                      settings_map_from_df, normalize_records_df, compact_records_df, record_arrays, records_from_arrays,
+                      records_from_frame)
+from .period import get_closing_period, closing_periods, PayLedger
+from .cache import DailySummaryCache
+from .summary import summarize_records_df, summarize_days
+from .engine import EngineState, PayEngine
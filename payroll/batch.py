@@ -0,0 +1,87 @@
+# 全利用者の締め期間の給与を一括計算する (シートを書き出したファイルからオフラインで実行)
+#   python -m payroll.batch --records records.csv --settings settings.csv --year 2026 --month 10 --out out/
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from .period import get_closing_period
+from .records import normalize_records_df, parse_user_settings, settings_map_from_df
+from .summary import summarize_records_df
+
+def read_table(path):
+    # CSV / Parquet を拡張子で判別し、文字列の列は文字列のまま読む
+    if path.endswith('.parquet'): return pd.read_parquet(path)
+    return pd.read_csv(path, dtype={'user_id': str, 'date_str': str, 'key': str, 'value': str, 'type': str})
+
+def write_table(df, path):
+    if path.endswith('.parquet'): df.to_parquet(path, index=False)
+    else: df.to_csv(path, index=False)
+
+def _run_chunk(jobs):
+    # jobs: (user_id, 設定, 期間開始, 期間終了, その利用者の期間内の記録) のリスト
+    # 利用者の時給を行に付け、"user_id/date_str" を日付キーにしてまとめて1回で計算する
+    frames = [df_user.assign(date_str=user_id + '/' + df_user['date_str'], base_wage=settings['base_wage'], wage_drive=settings['wage_drive'])
+              for user_id, settings, _, _, df_user in jobs if not df_user.empty]
+    daily = summarize_records_df(pd.concat(frames), 0, 0) if frames else summarize_records_df(pd.DataFrame(), 0, 0)
+    # 記録の無いチャンクでは空の (整数の) 索引になるので、文字列にしてから分ける
+    keys = daily.index.astype(str).str.rsplit('/', n=1)
+    daily = daily.assign(user_id=keys.str[0], date_str=keys.str[1], worked=daily['min'] > 0).reset_index(drop=True)
+    totals = daily.groupby('user_id')[['pay', 'min', 'worked']].sum()
+
+    users = []
+    for user_id, settings, s_str, e_str, _ in jobs:
+        pay, mins, worked = totals.loc[user_id].tolist() if user_id in totals.index else (0, 0, 0)
+        users.append({'user_id': user_id, 'closing_day': settings['closing_day'], 'period_start': s_str, 'period_end': e_str,
+                      'pay': int(pay), 'minutes': int(mins), 'days': int(worked)})
+    return users, daily.rename(columns={'min': 'minutes'})[['user_id', 'date_str', 'pay', 'minutes']]
+
+def plan_jobs(df_rec, df_set, year, month):
+    # 利用者ごとの締め日で期間を決め、その期間の記録だけを渡す
+    settings_map = settings_map_from_df(df_set)
+    user_ids = sorted((set(df_rec['user_id'].astype(str)) | set(settings_map)) - {'common'})
+    groups = dict(tuple(df_rec.groupby('user_id'))) if not df_rec.empty else {}
+    jobs = []
+    for user_id in user_ids:
+        settings = parse_user_settings(settings_map.get(user_id, {}))
+        s_date, e_date, _ = get_closing_period(year, month, settings['closing_day'])
+        s_str, e_str = s_date.strftime("%Y-%m-%d"), e_date.strftime("%Y-%m-%d")
+        df_user = groups.get(user_id, df_rec.iloc[:0])
+        df_user = df_user[(df_user['date_str'] >= s_str) & (df_user['date_str'] <= e_str)]
+        jobs.append((user_id, settings, s_str, e_str, df_user))
+    return jobs
+
+def run_batch(df_rec, df_set, year, month, workers=None, chunk_size=200):
+    jobs = plan_jobs(normalize_records_df(df_rec), df_set, year, month)
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        results = list(map(_run_chunk, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_chunk, chunks))
+    users = [u for chunk_users, _ in results for u in chunk_users]
+    df_days = pd.concat([chunk_days for _, chunk_days in results], ignore_index=True) if results else pd.DataFrame(columns=['user_id', 'date_str', 'pay', 'minutes'])
+    return pd.DataFrame(users, columns=['user_id', 'closing_day', 'period_start', 'period_end', 'pay', 'minutes', 'days']), df_days
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="全利用者の締め期間の給与を一括計算する")
+    parser.add_argument('--records', required=True, help="records シートの書き出し (.csv / .parquet)")
+    parser.add_argument('--settings', required=True, help="settings シートの書き出し (.csv / .parquet)")
+    parser.add_argument('--year', type=int, required=True)
+    parser.add_argument('--month', type=int, required=True, help="締め日が属する月")
+    parser.add_argument('--out', default='.', help="出力先ディレクトリ")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--workers', type=int, default=None, help="プロセス数 (既定: CPU数)")
+    parser.add_argument('--chunk-size', type=int, default=200, help="1タスクあたりの利用者数")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    df_users, df_days = run_batch(read_table(args.records), read_table(args.settings), args.year, args.month, args.workers, args.chunk_size)
+    os.makedirs(args.out, exist_ok=True)
+    tag = f"{args.year}{args.month:02}"
+    write_table(df_users, os.path.join(args.out, f"payroll_users_{tag}.{args.format}"))
+    write_table(df_days, os.path.join(args.out, f"payroll_days_{tag}.{args.format}"))
+    print(f"{len(df_users)}人 / {len(df_days)}日分 / 合計 ¥{int(df_users['pay'].sum()):,} ({time.perf_counter() - started:.1f}秒)")
+
+if __name__ == '__main__':
+    main()
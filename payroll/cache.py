@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+
+# --- 日別集計キャッシュ ---
+# キー: (user_id, date_str, その日の記録のハッシュ, base_wage, wage_drive, PayRules.key)
+class DailySummaryCache:
+    def __init__(self, max_entries=50000, max_ledgers=256):
+        self.max_entries = max_entries
+        self.max_ledgers = max_ledgers
+        self.entries = OrderedDict()
+        self.user_keys = {}
+        self.hits = 0
+        self.misses = 0
+        self.ledgers = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self.user_keys.setdefault(key[0], set()).add(key)
+            while len(self.entries) > self.max_entries:
+                old, _ = self.entries.popitem(last=False)
+                self._forget(old)
+
+    def get_ledger(self, key, ttl=600):
+        # key: (user_id, base_wage, wage_drive)。シートの TTL と同じだけ使い回す
+        with self.lock:
+            entry = self.ledgers.get(key)
+            if entry is None: return None
+            if time.monotonic() - entry[0] > ttl:
+                del self.ledgers[key]
+                return None
+            self.ledgers.move_to_end(key)
+            return entry[1]
+
+    def put_ledger(self, key, ledger, ttl=600):
+        # 期限切れを捨て、残りも max_ledgers 件までに抑える (古く使われていない順に捨てる)
+        with self.lock:
+            now = time.monotonic()
+            for old in [k for k, (t, _) in self.ledgers.items() if now - t > ttl]: del self.ledgers[old]
+            self.ledgers[key] = (now, ledger)
+            self.ledgers.move_to_end(key)
+            while len(self.ledgers) > self.max_ledgers: self.ledgers.popitem(last=False)
+
+    def invalidate(self, user_id, date_str=None):
+        with self.lock:
+            for key in [k for k in self.ledgers if k[0] == user_id]: del self.ledgers[key]
+            for key in list(self.user_keys.get(user_id, ())):
+                if date_str is None or key[1] == date_str:
+                    del self.entries[key]
+                    self._forget(key)
+
+    def _forget(self, key):
+        keys = self.user_keys.get(key[0])
+        if keys is None: return
+        keys.discard(key)
+        if not keys: del self.user_keys[key[0]]
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'ledgers': len(self.ledgers), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,100 @@
+import math
+from .records import Record
+NIGHT_START = 22 * 60
+NIGHT_END = 27 * 60
+OVERTIME_THRESHOLD = 8 * 60
+
+# 割増率は 1/10000 単位の整数で持つ (1.25 -> 12500)
+MULT_SCALE = 10000
+MULT_EXTRA = 12500
+DAY_MINUTES = 48 * 60
+# 深夜の割増は他の割増率に掛け合わせる (残業の深夜 = 1.25 x 1.25 = 1.5625) ので、
+# 時給 x 分 x 割増率 x 深夜割増率 を整数で積算し、最後にこの値で割る
+POINTS_DIVISOR = 60 * MULT_SCALE * MULT_SCALE
+
+# --- 割増の規則 ---
+# 時刻・閾値は分。weekly_threshold (週の所定内の上限) と period_overtime_threshold
+# (締め期間の残業の上限。超えた分は mult_period_overtime) は None なら使わない。
+# 日をまたぐ規則なので、これらを使うときは PayEngine で計算する
+class PayRules:
+    def __init__(self, night_start=NIGHT_START, night_end=NIGHT_END, daily_threshold=OVERTIME_THRESHOLD,
+                 weekly_threshold=None, week_start=6, period_overtime_threshold=None,
+                 mult_overtime=MULT_EXTRA, mult_night=MULT_EXTRA, mult_period_overtime=MULT_EXTRA):
+        self.night_start = night_start
+        self.night_end = night_end
+        self.daily_threshold = daily_threshold
+        self.weekly_threshold = weekly_threshold
+        self.week_start = week_start  # 週の始まりの曜日 (date.weekday() の値。既定は日曜)
+        self.period_overtime_threshold = period_overtime_threshold
+        self.mult_overtime = mult_overtime
+        self.mult_night = mult_night
+        self.mult_period_overtime = mult_period_overtime
+
+    @property
+    def key(self):
+        # キャッシュのキーに使う
+        return (self.night_start, self.night_end, self.daily_threshold, self.weekly_threshold, self.week_start,
+                self.period_overtime_threshold, self.mult_overtime, self.mult_night, self.mult_period_overtime)
+
+    @property
+    def daily_only(self):
+        return self.weekly_threshold is None and self.period_overtime_threshold is None
+
+    def is_night(self, minute):
+        return self.night_start <= minute < self.night_end
+
+    def weighted(self, normal, over, night, period_over=0):
+        # 分数に割増率を掛けた値 (POINTS_DIVISOR で割る前)
+        w = normal * MULT_SCALE + over * self.mult_overtime + period_over * self.mult_period_overtime
+        return w * (self.mult_night if night else MULT_SCALE)
+
+DEFAULT_RULES = PayRules()
+
+def calculate_driving_allowance(km):
+    km = int(km)
+    if km == 0: return 0
+    if km < 10: return 150
+    if km >= 340: return 3300
+    return 300 + (math.floor((km - 10) / 30) * 300)
+
+def calculate_direct_drive_pay(km):
+    return int(km) * 25
+
+def day_segments(records, rules=DEFAULT_RULES):
+    # 1日分の記録 (Record。シートの行の dict も可) を (固定給, [(開始, 終了, 'WORK' | 'DRIVE'), ...]) にする。
+    # 区切り点 (記録の境界・深夜帯の境界) で1日を区間に分割し、後勝ちで種別を決める (休憩の区間は含めない)
+    fixed_pay = 0
+    spans = []
+
+    records = [r if isinstance(r, Record) else Record.from_row(r) for r in records]
+    for r in sorted((r for r in records if r is not None), key=lambda r: r.start):
+        if r.type == 'OTHER': fixed_pay += r.pay
+        elif r.type == 'DRIVE_DIRECT': fixed_pay += calculate_direct_drive_pay(r.km)
+        elif r.type in ('WORK', 'DRIVE', 'BREAK'):
+            if r.type == 'DRIVE': fixed_pay += calculate_driving_allowance(r.km)
+            s, e = max(r.start, 0), min(r.end, DAY_MINUTES)
+            if s < e: spans.append((s, e, r.type))
+
+    points = sorted({p for s, e, _ in spans for p in (s, e)} | {rules.night_start, rules.night_end})
+    segments = []
+    for a, b in zip(points, points[1:]):
+        act = next((t for s, e, t in reversed(spans) if s <= a and b <= e), None)
+        if act in ('WORK', 'DRIVE'): segments.append((a, b, act))
+    return fixed_pay, segments
+
+def calculate_daily_total(records, base_wage, drive_wage, rules=DEFAULT_RULES):
+    # その日だけで決まる規則 (1日の残業・深夜) で計算する
+    base_rate, drive_rate = int(base_wage), int(drive_wage)
+    fixed_pay, segments = day_segments(records, rules)
+    total_wage_points = 0
+    work_mins = 0
+
+    for a, b, act in segments:
+        rate = drive_rate if act == 'DRIVE' else base_rate
+        length = b - a
+        normal = min(max(rules.daily_threshold - work_mins, 0), length)
+        total_wage_points += rate * rules.weighted(normal, length - normal, rules.is_night(a))
+        work_mins += length
+
+    final_pay = total_wage_points // POINTS_DIVISOR
+    return final_pay + fixed_pay, work_mins
@@ -0,0 +1,123 @@
+# --- 期間をまたぐ給与計算 ---
+# 利用者1人分の記録を日付順に1回だけ流し、週・締め期間の累計を持ち越しながら日ごとの給与を計算する。
+# 計算した日ごとに、その日を終えた時点の状態 (チェックポイント) を残しておき、
+# ある日の記録が変わったときはその前日までの状態から再開してその日以降だけを計算し直す
+import datetime
+from bisect import bisect_left
+from itertools import groupby
+from .calc import DEFAULT_RULES, POINTS_DIVISOR, day_segments
+from .period import get_closing_period, PayLedger
+
+class EngineState:
+    # week / period はその日が属する週・締め期間の初日 ('%Y-%m-%d')
+    __slots__ = ('date_str', 'week', 'week_min', 'period', 'period_min', 'period_over', 'period_night')
+
+    def __init__(self, date_str=None, week=None, week_min=0, period=None, period_min=0, period_over=0, period_night=0):
+        self.date_str = date_str
+        self.week = week
+        self.week_min = week_min          # 週の所定内の分 (残業にならなかった分)
+        self.period = period
+        self.period_min = period_min      # 締め期間の稼働分
+        self.period_over = period_over    # 締め期間の残業分
+        self.period_night = period_night  # 締め期間の深夜の稼働分
+
+    def copy(self):
+        return EngineState(self.date_str, self.week, self.week_min, self.period, self.period_min, self.period_over, self.period_night)
+
+    def __repr__(self):
+        return (f"EngineState({self.date_str!r}, week {self.week} {self.week_min}分, period {self.period} "
+                f"{self.period_min}分 / 残業 {self.period_over}分 / 深夜 {self.period_night}分)")
+
+class PayEngine:
+    def __init__(self, base_wage, drive_wage, closing_day=31, rules=DEFAULT_RULES):
+        self.base_rate = int(base_wage)
+        self.drive_rate = int(drive_wage)
+        self.closing_day = int(closing_day)
+        self.rules = rules
+        self.daily = {}        # date_str -> {'pay', 'min', 'over', 'night'}
+        self.dates = []        # 計算済みの日付 (昇順)
+        self.checkpoints = {}  # date_str -> その日を終えた時点の EngineState
+        self._periods = {}
+
+    def run(self, records, since=None):
+        # records: 日付順の Record (同じ日の記録は続けて並んでいること)。
+        # since ('%Y-%m-%d') を渡すと since より前の計算結果は残し、since 以降を records で置き換える
+        # (records は since 以降の分だけでよい)。計算し直した日付のリストを返す
+        state = self._discard_from(since)
+        done = []
+        for date_str, day in groupby(records, key=lambda r: r.date_str):
+            if since and date_str < since: continue
+            state = self._run_day(state, date_str, list(day))
+            done.append(date_str)
+        return done
+
+    def state_before(self, date_str):
+        # date_str より前の最後のチェックポイント (なければ初期状態)
+        i = bisect_left(self.dates, date_str)
+        return self.checkpoints[self.dates[i - 1]].copy() if i else EngineState()
+
+    def ledger(self):
+        return PayLedger(self.daily)
+
+    def _discard_from(self, date_str):
+        if date_str is None:
+            self.daily, self.dates, self.checkpoints = {}, [], {}
+            return EngineState()
+        state = self.state_before(date_str)
+        i = bisect_left(self.dates, date_str)
+        for d in self.dates[i:]:
+            del self.daily[d]
+            del self.checkpoints[d]
+        del self.dates[i:]
+        return state
+
+    def _period_start(self, d):
+        # d を含む締め期間の初日 (d がその月の締め日を過ぎていれば、翌月の締め日で終わる期間)
+        s_str, e_date = self._period(d.year, d.month)
+        if d <= e_date: return s_str
+        return self._period(d.year + 1, 1)[0] if d.month == 12 else self._period(d.year, d.month + 1)[0]
+
+    def _period(self, year, month):
+        if (year, month) not in self._periods:
+            s_date, e_date, _ = get_closing_period(year, month, self.closing_day)
+            self._periods[(year, month)] = (s_date.isoformat(), e_date)
+        return self._periods[(year, month)]
+
+    def _run_day(self, state, date_str, records):
+        rules = self.rules
+        d = datetime.date.fromisoformat(date_str)
+        week = (d - datetime.timedelta(days=(d.weekday() - rules.week_start) % 7)).isoformat()
+        period = self._period_start(d)
+        state = state.copy()
+        state.date_str = date_str
+        if state.week != week: state.week, state.week_min = week, 0
+        if state.period != period: state.period, state.period_min, state.period_over, state.period_night = period, 0, 0, 0
+
+        fixed_pay, segments = day_segments(records, rules)
+        points = day_min = day_over = day_night = 0
+        for a, b, act in segments:
+            length = b - a
+            # 1日の閾値と週の閾値のどちらかを超えた分が残業
+            normal = min(max(rules.daily_threshold - day_min, 0), length)
+            if rules.weekly_threshold is not None: normal = min(normal, max(rules.weekly_threshold - state.week_min, 0))
+            over = length - normal
+            # 締め期間の残業が閾値を超えた分は別の割増率
+            period_over = 0
+            if rules.period_overtime_threshold is not None:
+                period_over = min(over, max(state.period_over + over - rules.period_overtime_threshold, 0))
+            night = rules.is_night(a)
+            rate = self.drive_rate if act == 'DRIVE' else self.base_rate
+            points += rate * rules.weighted(normal, over - period_over, night, period_over)
+
+            day_min += length
+            day_over += over
+            if night: day_night += length
+            state.week_min += normal
+            state.period_over += over
+
+        state.period_min += day_min
+        state.period_night += day_night
+        self.daily[date_str] = {'pay': points // POINTS_DIVISOR + fixed_pay, 'min': day_min, 'over': day_over, 'night': day_night}
+        self.checkpoints[date_str] = state
+        self.dates.append(date_str)
+        return state
@@ -0,0 +1,51 @@
+import calendar
+import datetime
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+def get_closing_period(year, month, closing_day):
+    if closing_day == 31:
+        s_date, e_date = datetime.date(year, month, 1), datetime.date(year, month, calendar.monthrange(year, month)[1])
+        label = f"{year}年{month}月1日～{e_date.day}日 (カレンダー月)"
+    else:
+        prev_m = 12 if month == 1 else month - 1
+        prev_y = year - 1 if month == 1 else year
+        s_date = datetime.date(prev_y, prev_m, min(closing_day + 1, calendar.monthrange(prev_y, prev_m)[1]))
+        e_date = datetime.date(year, month, min(closing_day, calendar.monthrange(year, month)[1]))
+        label = f"{prev_y}年{prev_m}月{s_date.day}日～{year}年{month}月{e_date.day}日 ({closing_day}日締め)"
+    return s_date, e_date, label
+
+def closing_periods(year, closing_day):
+    # その年の12回分の締め期間 (各月の締め日で終わる期間)
+    return [get_closing_period(year, m, closing_day) for m in range(1, 13)]
+
+# --- 期間集計 (累積和) ---
+class PayLedger:
+    def __init__(self, summary):
+        self.daily = summary
+        self.dates = sorted(summary)
+        self.cum_pay = list(accumulate((summary[d]['pay'] for d in self.dates), initial=0))
+        self.cum_min = list(accumulate((summary[d]['min'] for d in self.dates), initial=0))
+
+    def total(self, start_date, end_date):
+        # 期間 [start_date, end_date] の合計 (日付は date か '%Y-%m-%d')
+        s = start_date if isinstance(start_date, str) else start_date.strftime("%Y-%m-%d")
+        e = end_date if isinstance(end_date, str) else end_date.strftime("%Y-%m-%d")
+        i, j = bisect_left(self.dates, s), bisect_right(self.dates, e)
+        if j <= i: return 0, 0
+        return self.cum_pay[j] - self.cum_pay[i], self.cum_min[j] - self.cum_min[i]
+
+    def report(self, periods):
+        # periods: (開始日, 終了日, ラベル) のリスト
+        rows = []
+        for s_date, e_date, label in periods:
+            pay, mins = self.total(s_date, e_date)
+            rows.append({'期間': label, '給与': pay, '稼働': f"{mins//60}時間{mins%60}分"})
+        return rows
+
+    def annual_report(self, year, closing_day):
+        return self.report(closing_periods(year, closing_day))
+
+    def quarterly_report(self, year, closing_day):
+        periods = closing_periods(year, closing_day)
+        return self.report([(periods[q*3][0], periods[q*3+2][1], f"{year}年 第{q+1}四半期") for q in range(4)])
@@ -0,0 +1,100 @@
+RECORD_TYPES = ('WORK', 'BREAK', 'DRIVE', 'DRIVE_DIRECT', 'OTHER')
+USER_SETTING_DEFAULTS = {'base_wage': 1190, 'wage_drive': 1050, 'closing_day': 31}
+SETTING_COLUMNS = ['user_id', 'key', 'value']
+
+def parse_user_settings(raw):
+    # 設定シートの文字列を数値にする (未保存・不正な値は既定値)
+    settings = {}
+    for key, default in USER_SETTING_DEFAULTS.items():
+        try: settings[key] = int(float(raw[key])) if key in raw else default
+        except: settings[key] = default
+    return settings
+
+def settings_map_from_df(df):
+    # 設定シートから user_id -> {key: value} (同じキーが複数あれば先頭の行を使う)
+    settings = {}
+    if df.empty or 'user_id' not in df.columns: return settings
+    for uid, key, value in df[SETTING_COLUMNS].astype(str).itertuples(index=False, name=None):
+        settings.setdefault(uid, {}).setdefault(key, value)
+    return settings
+
+def normalize_records_df(df):
+    # 記録シートの空欄を 0 にし、id を整数にする (user_id 列が無い古いシートは 'default')
+    import pandas as pd
+    df = df.fillna(0)
+    df['id'] = pd.to_numeric(df['id'], errors='coerce').fillna(0).astype(int)
+    if 'user_id' not in df.columns: df['user_id'] = 'default'
+    return df
+
+# --- 型付きの記録 ---
+# 読み込み時に一度だけ 開始・終了 (0時からの分)・距離 (km)・金額 を整数にしておく
+COMPACT_COLUMNS = ['id', 'user_id', 'date_str', 'type', 'start', 'end', 'km', 'pay']
+
+class Record:
+    __slots__ = ('id', 'user_id', 'date_str', 'type', 'start', 'end', 'km', 'pay')
+
+    def __init__(self, id, user_id, date_str, type, start, end, km, pay):
+        self.id = id
+        self.user_id = user_id
+        self.date_str = date_str
+        self.type = type
+        self.start = start
+        self.end = end
+        self.km = km
+        self.pay = pay
+
+    @classmethod
+    def from_row(cls, r):
+        # シートの1行 (dict) から作る (時刻・距離・金額を数値にできない行は None)
+        try:
+            start = int(float(r['start_h'])) * 60 + int(float(r['start_m']))
+            end = int(float(r['end_h'])) * 60 + int(float(r['end_m']))
+            km, pay = int(float(r['distance_km'])), int(float(r['pay_amount']))
+        except: return None
+        try: rid = int(float(r.get('id', 0)))
+        except: rid = 0
+        return cls(rid, r.get('user_id'), r.get('date_str'), r['type'], start, end, km, pay)
+
+    def __repr__(self):
+        return f"Record({self.id}, {self.user_id!r}, {self.date_str!r}, {self.type!r}, {format_time(*divmod(self.start, 60))}-{format_time(*divmod(self.end, 60))}, {self.km}km, {self.pay})"
+
+def compact_records_df(df, extra=()):
+    # シートの列 (start_h ... pay_amount) を COMPACT_COLUMNS の型付きの列にする。
+    # 種別は RECORD_TYPES のカテゴリ、時刻・距離は int32。数値にできない行は落とす。extra の列はそのまま残す
+    import numpy as np
+    import pandas as pd
+    if 'start' in df.columns: return df
+    src = ['start_h', 'start_m', 'end_h', 'end_m', 'distance_km', 'pay_amount']
+    missing = [c for c in src + ['id', 'user_id', 'date_str', 'type'] if c not in df.columns]
+    if missing: df = df.reindex(columns=list(df.columns) + missing)
+    num = df[src].fillna(0).apply(pd.to_numeric, errors='coerce')
+    ok = num.notna().all(axis=1).values
+    num = np.trunc(num[ok])
+    out = pd.DataFrame({
+        'id': pd.to_numeric(df['id'][ok], errors='coerce').fillna(0).astype('int64').values,
+        'user_id': df['user_id'][ok].astype(object).values,
+        'date_str': df['date_str'][ok].astype(object).values,
+        'type': pd.Categorical(df['type'][ok], categories=RECORD_TYPES),
+        'start': (num['start_h'] * 60 + num['start_m']).astype('int32').values,
+        'end': (num['end_h'] * 60 + num['end_m']).astype('int32').values,
+        'km': num['distance_km'].astype('int32').values,
+        'pay': num['pay_amount'].astype('int64').values,
+    })
+    for c in extra: out[c] = df[c][ok].values
+    return out
+
+def record_arrays(df):
+    # 型付きの列を COMPACT_COLUMNS 順の numpy 配列にする (種別はカテゴリから文字列に戻す)
+    import numpy as np
+    return [np.asarray(df[c], dtype=object) if c == 'type' else df[c].values for c in COMPACT_COLUMNS]
+
+def records_from_arrays(arrays, a, b):
+    # 配列の [a, b) 行から Record のリストを作る (1日分など小さな範囲に使う)
+    return [Record(*row) for row in zip(*(arr[a:b].tolist() for arr in arrays))]
+
+def records_from_frame(df):
+    return records_from_arrays(record_arrays(df), 0, len(df))
+
+def format_time(h, m):
+    prefix = "翌" if h >= 24 else ""
+    return f"{prefix}{h-24 if h>=24 else h:02}:{m:02}"
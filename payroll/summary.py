@@ -0,0 +1,97 @@
+# pandas / numpy は一括計算を呼んだときにだけ読み込む
+from .calc import DAY_MINUTES, MULT_SCALE, POINTS_DIVISOR, DEFAULT_RULES
+from .records import compact_records_df
+
+def summarize_records_df(df, base_wage, drive_wage, start_date=None, end_date=None, rules=DEFAULT_RULES):
+    # calculate_daily_total と同じ規則で、全日付の給与・稼働分を一括計算する
+    # start_date / end_date ('%Y-%m-%d') を指定するとその期間の日付だけを計算する
+    # df に base_wage / wage_drive 列があれば行ごとの時給としてそちらを使う
+    # df はシートの列でも compact_records_df の型付きの列でもよい
+    import numpy as np
+    import pandas as pd
+    df = compact_records_df(df, extra=[c for c in ('base_wage', 'wage_drive') if c in df.columns])
+    if start_date is not None: df = df[df['date_str'] >= start_date]
+    if end_date is not None: df = df[df['date_str'] <= end_date]
+    if df.empty: return pd.DataFrame({'pay': [], 'min': []}, dtype='int64').rename_axis('date_str')
+    dates = pd.Index(df['date_str'].unique(), name='date_str')
+
+    d = pd.DataFrame({
+        'date_str': df['date_str'].values,
+        'type': np.asarray(df['type'], dtype=object),
+        'start': df['start'].astype('int64').values,
+        'end': df['end'].astype('int64').values,
+        'km': df['km'].astype('int64').values,
+        'amount': df['pay'].values,
+        'base': df['base_wage'].astype('int64').values if 'base_wage' in df.columns else int(base_wage),
+        'drive': df['wage_drive'].astype('int64').values if 'wage_drive' in df.columns else int(drive_wage),
+    })
+    # 開始時刻順 (同時刻は元の並び順) に後勝ちの順位を付ける
+    d = d.sort_values(['date_str', 'start'], kind='stable').reset_index(drop=True)
+    d['seq'] = np.arange(len(d))
+
+    # 固定給 (その他・直行直帰・運転手当)
+    km = d['km']
+    allowance = np.select([km == 0, km < 10, km >= 340], [0, 150, 3300], 300 + ((km - 10) // 30) * 300)
+    fixed = np.select([d['type'] == 'OTHER', d['type'] == 'DRIVE_DIRECT', d['type'] == 'DRIVE'], [d['amount'], km * 25, allowance], 0)
+    fixed = pd.Series(fixed, dtype='int64').groupby(d['date_str']).sum()
+
+    # 時間帯の記録を区切り点で区間に分割し、各区間を覆う最後の記録を採用する
+    spans = d[d['type'].isin(['WORK', 'DRIVE', 'BREAK'])].copy()
+    spans['start'] = spans['start'].clip(lower=0)
+    spans['end'] = spans['end'].clip(upper=DAY_MINUTES)
+    spans = spans[spans['start'] < spans['end']]
+    span_dates = spans['date_str'].unique()
+    points = pd.concat([
+        spans[['date_str', 'start']].rename(columns={'start': 'a'}),
+        spans[['date_str', 'end']].rename(columns={'end': 'a'}),
+        pd.DataFrame({'date_str': np.repeat(span_dates, 2), 'a': np.tile([rules.night_start, rules.night_end], len(span_dates))}),
+    ]).drop_duplicates().sort_values(['date_str', 'a'])
+    points['b'] = points.groupby('date_str')['a'].shift(-1)
+    segs = points.dropna(subset=['b']).astype({'b': 'int64'}).reset_index(drop=True)
+    segs['seg'] = np.arange(len(segs))
+
+    cand = segs.merge(spans[['date_str', 'start', 'end', 'type', 'seq', 'base', 'drive']], on='date_str')
+    cand = cand[(cand['start'] <= cand['a']) & (cand['b'] <= cand['end'])]
+    win = cand.loc[cand.groupby('seg')['seq'].idxmax()]
+    win = win[win['type'].isin(['WORK', 'DRIVE'])].sort_values(['date_str', 'a'])
+
+    # 区間ごとに1日の残業の閾値で分割し、割増率を整数で積算する
+    length = win['b'] - win['a']
+    before = length.groupby(win['date_str']).cumsum() - length
+    normal = (rules.daily_threshold - before).clip(lower=0).clip(upper=length)
+    over = length - normal
+    night = (win['a'] >= rules.night_start) & (win['a'] < rules.night_end)
+    weighted = (normal * MULT_SCALE + over * rules.mult_overtime) * np.where(night, rules.mult_night, MULT_SCALE)
+    rate = np.where(win['type'] == 'DRIVE', win['drive'], win['base'])
+    points_sum = pd.Series(rate * weighted, index=win.index).groupby(win['date_str']).sum()
+
+    out = pd.DataFrame(index=dates)
+    wage = (points_sum // POINTS_DIVISOR).reindex(dates, fill_value=0)
+    out['pay'] = (wage + fixed.reindex(dates, fill_value=0)).astype('int64')
+    out['min'] = length.groupby(win['date_str']).sum().reindex(dates, fill_value=0).astype('int64')
+    return out
+
+def summarize_days(df_user, user_id, base_wage, drive_wage, cache, start_date=None, end_date=None, rules=DEFAULT_RULES):
+    # 日付ごとに記録内容のハッシュでキャッシュを引き、外れた日だけを一括計算する
+    import numpy as np
+    import pandas as pd
+    if start_date is not None: df_user = df_user[df_user['date_str'] >= start_date]
+    if end_date is not None: df_user = df_user[df_user['date_str'] <= end_date]
+    if df_user.empty: return {}
+    df_user = compact_records_df(df_user)
+    row_hash = pd.util.hash_pandas_object(df_user[['type', 'start', 'end', 'km', 'pay']], index=False).values
+    pos = df_user.groupby('date_str').cumcount().values.astype('uint64')
+    day_hash = pd.Series(row_hash * (pos * np.uint64(2) + np.uint64(1)), index=df_user.index).groupby(df_user['date_str']).sum()
+
+    summary, misses = {}, {}
+    for d_str, h in day_hash.items():
+        key = (user_id, d_str, int(h), int(base_wage), int(drive_wage), rules.key)
+        val = cache.get(key)
+        if val is None: misses[d_str] = key
+        else: summary[d_str] = val
+    if misses:
+        fresh = summarize_records_df(df_user[df_user['date_str'].isin(list(misses))], base_wage, drive_wage, rules=rules).to_dict('index')
+        for d_str, key in misses.items():
+            cache.put(key, fresh[d_str])
+            summary[d_str] = fresh[d_str]
+    return summary
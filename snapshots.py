@@ -0,0 +1,77 @@
+# --- シートのスナップショット (ディスク) ---
+# 取得したシートを Parquet で保存し、スプレッドシートの版 (最終更新時刻) をファイルのメタデータに入れておく。
+# 版が同じならネットワークから取り直さずにファイルを使う (再起動後やキャッシュを消した直後の最初の表示用)
+import logging
+import os
+import threading
+
+logger = logging.getLogger("salary.snapshots")
+
+class SnapshotStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def _path(self, worksheet):
+        return os.path.join(self.directory, f"{worksheet}.parquet")
+
+    def load(self, worksheet, revision):
+        # 保存したときの版が revision と同じならその DataFrame (違う・無い・読めないときは None)
+        try:
+            import pyarrow.parquet as pq
+            path = self._path(worksheet)
+            meta = pq.read_schema(path).metadata or {}
+            if meta.get(b'revision', b'').decode() != revision: raise LookupError(worksheet)
+            df = pq.read_table(path).to_pandas()
+        except Exception:
+            with self.lock: self.misses += 1
+            return None
+        with self.lock: self.hits += 1
+        return df
+
+    def save(self, worksheet, revision, df):
+        # 一時ファイルに書いてから置き換える (読み込み中の別プロセスに書きかけのファイルを見せない)。
+        # 保存できなくても表示は続けるが、失敗は数えてログに残す
+        tmp = None
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(_plain_columns(df), preserve_index=False)
+            table = table.replace_schema_metadata(dict(table.schema.metadata or {}, revision=revision))
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            tmp = f"{self._path(worksheet)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            pq.write_table(table, tmp)
+            os.replace(tmp, self._path(worksheet))
+        except Exception as e:
+            with self.lock: self.failures += 1
+            logger.warning("snapshot save failed: %s (%s)", worksheet, e)
+            if tmp is not None:
+                try: os.remove(tmp)
+                except OSError: pass
+
+    def discard(self, worksheet=None):
+        # 自分で書き込んだシートは、版 (最終更新時刻) の反映を待たずに消しておく
+        names = [worksheet] if worksheet else [f[:-len('.parquet')] for f in _listdir(self.directory) if f.endswith('.parquet')]
+        for name in names:
+            try: os.remove(self._path(name))
+            except OSError: pass
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'failures': self.failures}
+
+def _plain_columns(df):
+    # 文字列と数値が混ざった列は Parquet に書けないので、値のあるセルを文字列にそろえる
+    import pandas as pd
+    df = df.copy()
+    for c in df.columns:
+        if df[c].dtype == object and not df[c].map(lambda v: isinstance(v, str) or pd.isna(v)).all():
+            df[c] = df[c].map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+def _listdir(directory):
+    try: return os.listdir(directory)
+    except OSError: return []
@@ -0,0 +1,776 @@
+import contextvars
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from payroll.records import (SETTING_COLUMNS, compact_records_df, normalize_records_df, record_arrays, records_from_arrays,
+                             records_from_frame, settings_map_from_df)
+
+RECORD_COLUMNS = ['id', 'user_id', 'date_str', 'type', 'start_h', 'start_m', 'end_h', 'end_m', 'distance_km', 'pay_amount', 'duration_minutes']
+
+def _sheet_value(v):
+    return v.item() if hasattr(v, 'item') else v
+
+def _is_id(v):
+    return re.fullmatch(r'\d+(\.0+)?', str(v).strip()) is not None
+
+def sheet_ids(ws, columns):
+    # id列だけを読む (見出しが無ければ None)
+    ids = ws.col_values(columns.index('id') + 1)
+    if not ids or ids[0] != 'id': return None
+    return ids[1:]
+
+def append_record_rows(ws, columns, records):
+    # 採番済みの記録をまとめて1回で追記する
+    ws.append_rows([[_sheet_value(r.get(c, 0)) for c in columns] for r in records], value_input_option='USER_ENTERED')
+
+def delete_record_rows(ws, ids, record_ids):
+    # id列から対象行を探し、下の行から削除する (行番号がずれないように)
+    targets = {int(i) for i in record_ids}
+    rows = [i for i, v in enumerate(ids, start=2) if _is_id(v) and int(float(v)) in targets]
+    for row in reversed(rows): ws.delete_rows(row)
+
+# --- 差分書き込み ---
+# 直前に読んだシートと書き込みたい DataFrame を比べ、変わったセルと増えた行だけを送る
+def column_letter(n):
+    # 1 -> A, 27 -> AA
+    letters = ''
+    while n:
+        n, r = divmod(n - 1, 26)
+        letters = chr(65 + r) + letters
+    return letters
+
+def sheet_diff(old, new):
+    # old の行が new の先頭に同じ並びで残っている場合だけ (範囲のリスト, 追記する行) を返す
+    if list(old.columns) != list(new.columns) or len(new) < len(old) or not new.index[:len(old)].equals(old.index): return None
+    n = len(old)
+    ranges = []
+    for j, col in enumerate(old.columns, start=1):
+        before = old[col].astype(str).values
+        after = new[col].iloc[:n]
+        changed = (before != after.astype(str).values).nonzero()[0]
+        # 連続する行を1つの範囲にまとめる (シートの行番号は見出しの次から)
+        runs = []
+        for i in changed:
+            if runs and runs[-1][1] == i - 1: runs[-1][1] = i
+            else: runs.append([i, i])
+        letter = column_letter(j)
+        for a, b in runs:
+            ranges.append({'range': f"{letter}{a + 2}:{letter}{b + 2}", 'values': [[_sheet_value(v)] for v in after.values[a:b + 1]]})
+    rows = [[_sheet_value(v) for v in row] for row in new.iloc[n:].itertuples(index=False, name=None)]
+    return ranges, rows
+
+def _cell_key(v):
+    # シートのセルと DataFrame の値を同じ文字列にそろえて比べる (空欄は ''、整数は小数点なし)
+    if v is None or (not isinstance(v, str) and pd.isna(v)): return ''
+    v = str(v).strip()
+    return str(int(float(v))) if _is_id(v) else v
+
+def sheet_rows_match(ws, df):
+    # シートの行が df と同じ並びか。読み込みでは空行が落ちるので、1行でも空行があると
+    # DataFrame の位置から作った範囲が別の行を指してしまう。id 列 (無ければ先頭の2列) をシートから読んで確かめる
+    keys = ['id'] if 'id' in df.columns else list(df.columns[:2])
+    for col in keys:
+        values = ws.col_values(list(df.columns).index(col) + 1)
+        if not values or values[0] != col: return False
+        if [_cell_key(v) for v in values[1:]] != [_cell_key(v) for v in df[col].values]: return False
+    return True
+
+def sync_sheet(ws, old, new):
+    # 差分を batch_update 1回と append_rows 1回で送る (差分が取れない・シートの行が old とずれていれば False)
+    diff = sheet_diff(old, new)
+    if diff is None: return False
+    ranges, rows = diff
+    if ranges and not sheet_rows_match(ws, old): return False
+    if ranges: ws.batch_update(ranges, value_input_option='USER_ENTERED')
+    if rows: ws.append_rows(rows, value_input_option='USER_ENTERED')
+    return True
+
+# --- 書き込みキュー ---
+# 記録の追加・削除をセッションをまたいでまとめ、1回の書き込みで反映する。
+# 最初に来た要求がまとめ役になって書き込み、書き込み中に来た要求は次のまとまりで書く
+class WriteBatch:
+    def __init__(self):
+        self.ops = []
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+class WriteQueue:
+    def __init__(self, commit, window=0.0):
+        # commit(ops) は ops と同じ順の結果のリストを返す。window 秒だけ後続の要求を待ってから書く
+        self.commit = commit
+        self.window = window
+        self.lock = threading.Lock()
+        self.commit_lock = threading.Lock()
+        self.pending = None
+        self.batches = 0
+        self.ops = 0
+
+    def submit(self, op):
+        with self.lock:
+            batch = self.pending
+            leader = batch is None
+            if leader: batch = self.pending = WriteBatch()
+            index = len(batch.ops)
+            batch.ops.append(op)
+        if leader:
+            if self.window: time.sleep(self.window)
+            with self.commit_lock:
+                with self.lock:
+                    if self.pending is batch: self.pending = None
+                try:
+                    batch.results = self.commit(batch.ops)
+                except Exception as e:
+                    batch.error = e
+                finally:
+                    self.batches += 1
+                    self.ops += len(batch.ops)
+                    batch.done.set()
+        else:
+            batch.done.wait()
+        if batch.error is not None: raise batch.error
+        return batch.results[index]
+
+# --- 記録インデックス ---
+# 取得したスナップショットを一度だけ型付きの列 (compact_records_df) にし、利用者・日付順に並べて
+# user_id -> date_str -> 行の範囲 を持つ。記録は参照された日の分だけ Record にする
+class RecordIndex:
+    def __init__(self, df):
+        self.df = compact_records_df(df).sort_values(['user_id', 'date_str'], kind='stable').reset_index(drop=True)
+        self.arrays = record_arrays(self.df)
+        users, dates = self.df['user_id'].values, self.df['date_str'].values
+        self.days = {}
+        if len(users):
+            change = ((users[1:] != users[:-1]) | (dates[1:] != dates[:-1])).nonzero()[0] + 1
+            bounds = [0] + change.tolist() + [len(users)]
+            for a, b in zip(bounds, bounds[1:]):
+                self.days.setdefault(users[a], {})[dates[a]] = (a, b)
+        # 日付順に並んでいるので最初の日が最古
+        self.min_date = {uid: next(iter(days)) for uid, days in self.days.items()}
+
+    def _range(self, user_id, start_date=None, end_date=None):
+        days = [ab for d, ab in self.days.get(user_id, {}).items() if (start_date is None or d >= start_date) and (end_date is None or d <= end_date)]
+        return (days[0][0], days[-1][1]) if days else (0, 0)
+
+    def frame_of(self, user_id, start_date=None, end_date=None):
+        a, b = self._range(user_id, start_date, end_date)
+        return self.df.iloc[a:b]
+
+    def records_on(self, user_id, date_str):
+        a, b = self.days.get(user_id, {}).get(date_str, (0, 0))
+        return records_from_arrays(self.arrays, a, b)
+
+    def records_of(self, user_id, start_date=None, end_date=None):
+        return records_from_arrays(self.arrays, *self._range(user_id, start_date, end_date))
+
+    def min_date_of(self, user_id):
+        return self.min_date.get(user_id)
+
+# --- 記録のパーティション ---
+# 締まった年の記録は records から年ごとのシート (records_2024 など) に移し (archive_year)、records には
+# 移していない記録だけを残す。目録 (records_manifest) にはパーティション・利用者ごとの最初と最後の日付と
+# 最大の id を持ち、読み込みは範囲に重なるパーティションだけにする
+MANIFEST_SHEET = "records_manifest"
+MANIFEST_COLUMNS = ['partition', 'user_id', 'first_date', 'last_date', 'max_id']
+PARTITION_SHEET = re.compile(r'records_(\d{4})')
+
+def partition_name(year):
+    return f"records_{year}"
+
+def manifest_rows(partition, df):
+    # パーティションの記録 (normalize_records_df 済み) から目録の行を作る
+    g = df.groupby('user_id')
+    rows = pd.DataFrame({'first_date': g['date_str'].min(), 'last_date': g['date_str'].max(), 'max_id': g['id'].max()}).reset_index()
+    rows.insert(0, 'partition', partition)
+    return rows[MANIFEST_COLUMNS]
+
+class RecordManifest:
+    def __init__(self, df=None):
+        # 目録のシートが無い・空のときはパーティション無し
+        if df is None or 'partition' not in df.columns: df = pd.DataFrame(columns=MANIFEST_COLUMNS)
+        self.df = df
+        self.users = {}
+        for part, uid, first, last in df[['partition', 'user_id', 'first_date', 'last_date']].itertuples(index=False, name=None):
+            self.users.setdefault(str(uid), []).append((str(first), str(last), str(part)))
+        for spans in self.users.values(): spans.sort()
+        max_id = pd.to_numeric(df['max_id'], errors='coerce').max()
+        self.max_id = 0 if pd.isna(max_id) else int(max_id)
+
+    def partitions_of(self, user_id, start_date=None, end_date=None):
+        # 利用者の記録があるパーティションのうち、範囲に重なるもの (古い順)
+        return [part for first, last, part in self.users.get(user_id, ())
+                if (end_date is None or first <= end_date) and (start_date is None or last >= start_date)]
+
+    def min_date_of(self, user_id):
+        spans = self.users.get(user_id)
+        return spans[0][0] if spans else None
+
+# --- ユーザー台帳 ---
+# 設定シートの user_N_id / user_N_pw 行から ID -> 番号 -> パスワード を一度だけ組み立てる
+ACCOUNT_KEY = re.compile(r'user_([^_]+)_(id|pw)')
+
+def account_rows(df):
+    if df.empty or 'key' not in df.columns: return []
+    return df[['key', 'value']].astype(str).itertuples(index=False, name=None)
+
+class UserRegistry:
+    def __init__(self, rows):
+        self.lock = threading.Lock()
+        self.ids = {}
+        self.pws = {}
+        for key, value in rows:
+            m = ACCOUNT_KEY.fullmatch(key)
+            if m is None: continue
+            (self.ids if m.group(2) == 'id' else self.pws).setdefault(m.group(1), value)
+        self._rebuild()
+
+    def _rebuild(self):
+        self.auth = {"admin": "admin"}
+        for num, uid in self.ids.items():
+            if num in self.pws and uid != "admin": self.auth[uid] = self.pws[num]
+        nums = [int(n) for n in self.ids if n.isdigit()]
+        self.next_num = max(nums) + 1 if nums else 1
+
+    def __contains__(self, user_id):
+        return user_id in self.auth
+
+    def password_of(self, user_id):
+        return self.auth.get(user_id)
+
+    def check(self, user_id, password):
+        return user_id in self.auth and self.auth[user_id] == password
+
+    def next_user_number(self):
+        return self.next_num
+
+    def accounts(self):
+        with self.lock:
+            return [{"ID": uid, "PW": self.pws.get(num, "")} for num, uid in self.ids.items()]
+
+    def apply_settings(self, values):
+        # 保存したキーのうちアカウント行だけをその場で反映する
+        with self.lock:
+            changed = False
+            for key, value in values.items():
+                m = ACCOUNT_KEY.fullmatch(key)
+                if m is None: continue
+                (self.ids if m.group(2) == 'id' else self.pws)[m.group(1)] = str(value)
+                changed = True
+            if changed: self._rebuild()
+
+    def rename(self, old_id, new_id, new_password):
+        with self.lock:
+            for num, uid in list(self.ids.items()):
+                if uid == old_id:
+                    self.ids[num] = new_id
+                    self.pws[num] = new_password
+            self._rebuild()
+
+# --- ストレージ共通インターフェース ---
+# save_record / delete_record / update_user_id は影響した (user_id, date_str) のリストを返す
+class Storage:
+    def read_sheet(self, worksheet, fresh=False):
+        raise NotImplementedError
+
+    def get_all_records_df(self):
+        try:
+            return normalize_records_df(self.read_sheet("records"))
+        except Exception:
+            return pd.DataFrame(columns=RECORD_COLUMNS)
+
+    def get_records_df(self, user_id, start_date=None, end_date=None):
+        # 利用者の記録を型付きの列 (compact_records_df) で返す
+        df = self.get_all_records_df()
+        if df.empty: return compact_records_df(df)
+        mask = df['user_id'] == user_id
+        if start_date is not None: mask &= df['date_str'] >= start_date
+        if end_date is not None: mask &= df['date_str'] <= end_date
+        return compact_records_df(df[mask])
+
+    def invalidate(self, worksheet=None):
+        pass
+
+    def load_snapshot(self, worksheets=("records", "settings")):
+        # 期限切れのシートをまとめて読み込む (読み込んだシートの DataFrame を返す)
+        return {}
+
+    def get_records_by_date(self, user_id, date_str):
+        return records_from_frame(self.get_records_df(user_id, date_str, date_str))
+
+    def get_records_by_user(self, user_id):
+        return records_from_frame(self.get_records_df(user_id))
+
+    def get_min_record_date(self, user_id):
+        df = self.get_records_df(user_id)
+        return None if df.empty else df['date_str'].min()
+
+    def save_record(self, record_data):
+        raise NotImplementedError
+
+    def delete_record(self, record_id):
+        raise NotImplementedError
+
+    def load_settings(self, user_id="common"):
+        return dict(settings_map_from_df(self.read_sheet("settings")).get(user_id, {}))
+
+    def save_settings(self, user_id, values):
+        raise NotImplementedError
+
+    def user_registry(self):
+        return UserRegistry(account_rows(self.read_sheet("settings")))
+
+    def update_user_id(self, old_id, new_id, new_password, with_auth=True):
+        raise NotImplementedError
+
+    def archive_year(self, year):
+        raise NotImplementedError
+
+# --- Google Sheets ---
+class GSheetsStorage(Storage):
+    SNAPSHOT_TTL = 600
+    # シートごとに、そのシートから作る辞書 (_views のキー)
+    SHEET_VIEWS = {"records": ("records",), "settings": ("settings", "registry"), MANIFEST_SHEET: ("manifest",)}
+    WRITE_WINDOW = 0.0
+
+    def __init__(self, conn, reader=None, max_workers=4, snapshots=None):
+        self.conn = conn
+        # reader はキャッシュ付きの読み込み関数 (未指定なら毎回取得)
+        self.reader = reader
+        # snapshots はディスクのスナップショット (SnapshotStore)。未指定なら使わない
+        self.snapshots = snapshots
+        self._spreadsheet = None
+        self._views = {}
+        self._views_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sheet-read")
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        # 記録の書き込みはプロセス内で1本のキューに通す
+        self.writes = WriteQueue(self._commit_records, window=self.WRITE_WINDOW)
+        self._last_id = 0
+        # 設定シートの読み直しから書き込みまでもプロセス内で1つずつ行う (同時に保存した値を上書きしない)
+        self._settings_lock = threading.Lock()
+
+    def _view(self, worksheet, build):
+        # 書き込みか TTL 切れまで同じスナップショットから作った辞書を使い回す
+        with self._views_lock:
+            entry = self._views.get(worksheet)
+            if entry is None or time.monotonic() - entry[0] > self.SNAPSHOT_TTL:
+                entry = (time.monotonic(), build())
+                self._views[worksheet] = entry
+            return entry[1]
+
+    def invalidate(self, worksheet=None):
+        with self._views_lock:
+            if worksheet is None: self._views.clear()
+            else: self._views.pop(worksheet, None)
+
+    def _is_fresh(self, name):
+        entry = self._views.get(name)
+        return entry is not None and time.monotonic() - entry[0] <= self.SNAPSHOT_TTL
+
+    def _fetch(self, worksheet):
+        # 同じシートの読み込みが実行中ならその結果を待つ (セッションをまたいで相乗り)
+        with self._inflight_lock:
+            future = self._inflight.get(worksheet)
+            if future is not None: return future
+            # 呼び出し元のコンテキストで読む (再実行ごとの計測がシートの読み込みを数えられるように)
+            future = self._pool.submit(contextvars.copy_context().run, self.read_sheet, worksheet)
+            self._inflight[worksheet] = future
+        # 読み込みが既に終わっていると登録した時点で呼ばれるので、ロックの外で登録する
+        future.add_done_callback(lambda f: self._done(worksheet, f))
+        return future
+
+    def _done(self, worksheet, future):
+        with self._inflight_lock:
+            if self._inflight.get(worksheet) is future: del self._inflight[worksheet]
+
+    def load_snapshot(self, worksheets=("records", "settings", MANIFEST_SHEET)):
+        # 辞書が期限切れのシートだけを同時に読み込み、読めたものから辞書を作り直す。
+        # 最初の表示で records と settings を順に待たず、1回分の往復で済ませる
+        stale = [ws for ws in worksheets if not all(self._is_fresh(name) for name in self.SHEET_VIEWS.get(ws, ()))]
+        futures = {ws: self._fetch(ws) for ws in stale}
+        sheets = {}
+        for ws, future in futures.items():
+            try: sheets[ws] = future.result()
+            except Exception: continue
+        # 作れなかった辞書は後の参照時に通常どおり作る
+        try:
+            if "records" in sheets: self._view("records", lambda: RecordIndex(normalize_records_df(sheets["records"].copy())))
+            if "settings" in sheets:
+                self._view("settings", lambda: settings_map_from_df(sheets["settings"]))
+                self._view("registry", lambda: UserRegistry(account_rows(sheets["settings"])))
+            # 目録のシートが無い (まだアーカイブしていない) ときは空の目録を覚えておき、毎回読みに行かない
+            if MANIFEST_SHEET in futures: self._view("manifest", lambda: RecordManifest(sheets.get(MANIFEST_SHEET)))
+        except Exception:
+            pass
+        return sheets
+
+    def record_index(self):
+        return self._view("records", lambda: RecordIndex(self.get_all_records_df()))
+
+    def manifest(self):
+        def build():
+            try: return RecordManifest(self.read_sheet(MANIFEST_SHEET))
+            except Exception: return RecordManifest()
+        return self._view("manifest", build)
+
+    def _partition_index(self, name):
+        # アーカイブはこのクラスの中でしか書き換えないので、Streamlit のキャッシュを通さずに読む (ディスクのスナップショットは使う)
+        def build():
+            try: return RecordIndex(normalize_records_df(self.load_sheet(name)))
+            except Exception: return RecordIndex(pd.DataFrame(columns=RECORD_COLUMNS))
+        return self._view(name, build)
+
+    def _indexes(self, user_id, start_date=None, end_date=None):
+        # 範囲に重なるアーカイブ (古い順) と records の索引
+        parts = self.manifest().partitions_of(user_id, start_date, end_date)
+        return [self._partition_index(part) for part in parts] + [self.record_index()]
+
+    def _cached_view(self, worksheet):
+        entry = self._views.get(worksheet)
+        return None if entry is None else entry[1]
+
+    def user_registry(self):
+        return self._view("registry", lambda: UserRegistry(account_rows(self.read_sheet("settings"))))
+
+    def settings_map(self):
+        return self._view("settings", lambda: settings_map_from_df(self.read_sheet("settings")))
+
+    def load_settings(self, user_id="common"):
+        return dict(self.settings_map().get(user_id, {}))
+
+    def get_records_df(self, user_id, start_date=None, end_date=None):
+        frames = [index.frame_of(user_id, start_date, end_date) for index in self._indexes(user_id, start_date, end_date)]
+        if len(frames) == 1: return frames[0]
+        # アーカイブ後に records へ足された古い日付の記録もあるので日付順に並べ直す
+        return pd.concat(frames, ignore_index=True).sort_values('date_str', kind='stable').reset_index(drop=True)
+
+    def get_records_by_date(self, user_id, date_str):
+        return [r for index in self._indexes(user_id, date_str, date_str) for r in index.records_on(user_id, date_str)]
+
+    def get_records_by_user(self, user_id):
+        indexes = self._indexes(user_id)
+        if len(indexes) == 1: return indexes[0].records_of(user_id)
+        return sorted((r for index in indexes for r in index.records_of(user_id)), key=lambda r: r.date_str)
+
+    def get_min_record_date(self, user_id):
+        # 全記録を見ずに、目録と records の索引の最古日から決める
+        dates = [d for d in (self.manifest().min_date_of(user_id), self.record_index().min_date_of(user_id)) if d]
+        return min(dates) if dates else None
+
+    def read_sheet(self, worksheet, fresh=False):
+        # fresh は書き込み前の読み直し (スナップショットを使わず必ず取得する)
+        if fresh: return self.conn.read(worksheet=worksheet, ttl=0)
+        if self.reader is None: return self.load_sheet(worksheet)
+        return self.reader(worksheet)
+
+    def load_sheet(self, worksheet):
+        # 表示用の取得。ディスクのスナップショットがスプレッドシートの今の版と同じならそれを使う
+        revision = self.revision() if self.snapshots is not None else None
+        if revision is None: return self.conn.read(worksheet=worksheet, ttl=0)
+        df = self.snapshots.load(worksheet, revision)
+        if df is not None: return df
+        # 版を先に取っておくので、保存する内容はその版以降のもの
+        df = self.conn.read(worksheet=worksheet, ttl=0)
+        self.snapshots.save(worksheet, revision, df)
+        return df
+
+    def revision(self):
+        # スプレッドシートの id と最終更新時刻 (Drive のメタデータだけを取る軽い呼び出し)。取れない接続では None
+        try:
+            if self._spreadsheet is None: self._spreadsheet = self.conn.client._open_spreadsheet()
+            # 別のスプレッドシートに切り替えたときに取り違えないよう id も含める
+            return f"{self._spreadsheet.id}@{self._spreadsheet.get_lastUpdateTime()}"
+        except Exception:
+            return None
+
+    def _wrote(self, worksheet):
+        # 書き込んだシートのスナップショットは、最終更新時刻の反映を待たずに捨てる
+        if self.snapshots is not None: self.snapshots.discard(worksheet)
+
+    def _worksheet(self, worksheet):
+        # サービスアカウント接続のときだけ gspread のワークシートを行単位で操作できる
+        client = getattr(self.conn, 'client', None)
+        if not hasattr(client, '_select_worksheet'): return None
+        return client._select_worksheet(worksheet=worksheet)
+
+    def _allocate_ids(self, saves, existing_ids):
+        # 採番は書き込みキューの中だけで行い、このプロセスで払い出した番号・アーカイブ済みの番号より小さくしない
+        next_id = max(max(existing_ids, default=0), self._last_id, self.manifest().max_id) + 1
+        for record_data in saves:
+            record_data['id'] = next_id
+            next_id += 1
+        self._last_id = next_id - 1
+
+    def _write_rows(self, columns, saves, deletes, worksheet="records"):
+        # 行単位で書けない (ワークシートか id 列の見出しが取れない) ときだけ False を返す。
+        # 削除・追記を送った後の失敗は、書き直しで記録が二重にならないようそのまま呼び出し元へ上げる
+        try:
+            ws = self._worksheet(worksheet)
+            ids = sheet_ids(ws, columns) if ws is not None else None
+        except Exception:
+            return False
+        if ids is None: return False
+        if deletes: delete_record_rows(ws, ids, deletes)
+        if saves:
+            self._allocate_ids(saves, [int(float(v)) for v in ids if _is_id(v)])
+            append_record_rows(ws, columns, saves)
+        return True
+
+    def _commit_records(self, ops):
+        # ops: ("save", record_data) / ("delete", record_id) のまとまりを1回の書き込みで反映する
+        saves = [arg for action, arg in ops if action == "save"]
+        deletes = [arg for action, arg in ops if action == "delete"]
+        cached = self.get_all_records_df()
+        columns = list(cached.columns) if 'id' in cached.columns else RECORD_COLUMNS
+        if not self._write_rows(columns, saves, deletes):
+            # 行単位で書けない場合は最新のシートを読み直し、全体を1回で書き直す
+            df = self.read_sheet("records", fresh=True)
+            df = normalize_records_df(df) if 'id' in df.columns else pd.DataFrame(columns=RECORD_COLUMNS)
+            if deletes: df = df[~df['id'].isin([int(i) for i in deletes])]
+            if saves:
+                self._allocate_ids(saves, df['id'].tolist())
+                df = pd.concat([df, pd.DataFrame(saves)], ignore_index=True)
+            self.conn.update(worksheet="records", data=df)
+        self._wrote("records")
+        self.invalidate("records")
+        return [None] * len(ops)
+
+    def _sync(self, worksheet, old, new):
+        # 行単位で操作できれば差分だけを送り、できなければシート全体を書き直す
+        try:
+            ws = self._worksheet(worksheet)
+            if ws is not None and sync_sheet(ws, old, new): return self._wrote(worksheet)
+        except Exception:
+            pass
+        self.conn.update(worksheet=worksheet, data=new)
+        self._wrote(worksheet)
+
+    def save_record(self, record_data):
+        self.writes.submit(("save", record_data))
+        return [(record_data['user_id'], record_data['date_str'])]
+
+    def delete_record(self, record_id):
+        df = self.get_all_records_df()
+        touched = list(df.loc[df['id'] == record_id, ['user_id', 'date_str']].itertuples(index=False, name=None)) if not df.empty else []
+        if not touched:
+            name, touched = self._find_archived(record_id)
+            if name is not None:
+                self._delete_archived(name, record_id)
+                return touched
+        self.writes.submit(("delete", record_id))
+        return touched
+
+    def _find_archived(self, record_id):
+        # 削除できるのは表示した記録だけなので、読み込み済みのアーカイブから探す
+        with self._views_lock:
+            indexes = [(name, entry[1]) for name, entry in self._views.items() if PARTITION_SHEET.fullmatch(name)]
+        for name, index in indexes:
+            hit = index.df[index.df['id'] == int(record_id)]
+            if len(hit): return name, list(hit[['user_id', 'date_str']].itertuples(index=False, name=None))
+        return None, []
+
+    def _delete_archived(self, name, record_id):
+        # 目録の日付は範囲の目安なので、削除では書き換えない
+        with self.writes.commit_lock:
+            if not self._write_rows(RECORD_COLUMNS, [], [record_id], worksheet=name):
+                df = normalize_records_df(self.read_sheet(name, fresh=True))
+                self.conn.update(worksheet=name, data=df[df['id'] != int(record_id)])
+            self._wrote(name)
+            self.invalidate(name)
+
+    def _write_sheet(self, worksheet, df, exists):
+        if exists: self.conn.update(worksheet=worksheet, data=df)
+        else: self.conn.create(worksheet=worksheet, data=df)
+        self._wrote(worksheet)
+
+    def archive_year(self, year):
+        # year 年の記録を records から records_{year} に移し、目録のその年の行を書き直す (移した行数を返す)。
+        # 途中で失敗しても記録を失わないよう、アーカイブと目録を書いてから records を書き直す
+        name = partition_name(year)
+        with self.writes.commit_lock:
+            hot = self.read_sheet("records", fresh=True)
+            if hot.empty: return 0
+            hot = normalize_records_df(hot)
+            mask = hot['date_str'].astype(str).str.startswith(f"{year}-")
+            if not mask.any(): return 0
+            try: archived = normalize_records_df(self.read_sheet(name, fresh=True))
+            except Exception: archived = None
+            part = hot[mask] if archived is None else pd.concat([archived, hot[mask]], ignore_index=True).drop_duplicates('id', keep='last')
+            self._write_sheet(name, part.reset_index(drop=True), exists=archived is not None)
+
+            try: manifest = self.read_sheet(MANIFEST_SHEET, fresh=True)
+            except Exception: manifest = None
+            rows = manifest_rows(name, part)
+            if manifest is not None and 'partition' in manifest.columns:
+                rows = pd.concat([manifest[manifest['partition'].astype(str) != name], rows], ignore_index=True)
+            self._write_sheet(MANIFEST_SHEET, rows, exists=manifest is not None)
+
+            self.conn.update(worksheet="records", data=hot[~mask].reset_index(drop=True))
+            self._wrote("records")
+            self._last_id = max(self._last_id, int(hot['id'].max()))
+        self.invalidate()
+        return int(mask.sum())
+
+    def _rename_archived(self, old_id, new_id):
+        # アーカイブと目録の user_id を書き換える (書き込みキューのロックの中で呼ぶ)
+        parts = self.manifest().partitions_of(old_id)
+        if not parts: return []
+        touched = []
+        for name in parts:
+            old = normalize_records_df(self.read_sheet(name, fresh=True))
+            df = old.copy()
+            mask = df['user_id'] == old_id
+            touched += [(old_id, d) for d in df.loc[mask, 'date_str'].unique()]
+            df.loc[mask, 'user_id'] = new_id
+            if mask.any(): self._sync(name, old, df)
+            self.invalidate(name)
+        old_man = self.read_sheet(MANIFEST_SHEET, fresh=True)
+        df_man = old_man.copy()
+        df_man.loc[df_man['user_id'] == old_id, 'user_id'] = new_id
+        self._sync(MANIFEST_SHEET, old_man, df_man)
+        self.invalidate("manifest")
+        return touched
+
+    def save_settings(self, user_id, values):
+        # 1回読んで全キーを反映し、1回だけ書き込む
+        with self._settings_lock:
+            try:
+                old = self.read_sheet("settings", fresh=True)
+            except:
+                old = pd.DataFrame(columns=SETTING_COLUMNS)
+            df = old.copy()
+            new_rows = []
+            for key, value in values.items():
+                match_index = df[(df['user_id'] == user_id) & (df['key'] == key)].index
+                if not match_index.empty:
+                    df.loc[match_index[0], 'value'] = str(value)
+                else:
+                    new_rows.append({'user_id': user_id, 'key': key, 'value': str(value)})
+            if new_rows: df = pd.concat([df, pd.DataFrame(new_rows)], ignore_index=True)
+            self._sync("settings", old, df)
+            self.invalidate("settings")
+        registry = self._cached_view("registry")
+        if registry is not None: registry.apply_settings(values)
+
+    def update_user_id(self, old_id, new_id, new_password, with_auth=True):
+        # Records update (書き込みキューと同じロックの中で最新のシートを書き直す)
+        touched = []
+        with self.writes.commit_lock:
+            old_rec = self.read_sheet("records", fresh=True)
+            if not old_rec.empty:
+                old_rec = normalize_records_df(old_rec)
+                df_rec = old_rec.copy()
+                mask = df_rec['user_id'] == old_id
+                touched = [(old_id, d) for d in df_rec.loc[mask, 'date_str'].unique()]
+                df_rec.loc[mask, 'user_id'] = new_id
+                if mask.any(): self._sync("records", old_rec, df_rec)
+                self.invalidate("records")
+            touched += self._rename_archived(old_id, new_id)
+
+        # Settings update
+        with self._settings_lock:
+            old_set = self.read_sheet("settings", fresh=True)
+            if not old_set.empty:
+                df_set = old_set.copy()
+                df_set.loc[df_set['user_id'] == old_id, 'user_id'] = new_id
+                # Auth update
+                if with_auth:
+                    id_rows = df_set[(df_set['value'] == old_id) & df_set['key'].astype(str).str.endswith('_id')]
+                    nums = id_rows['key'].str.split('_').str[1]
+                    df_set.loc[id_rows.index, 'value'] = new_id
+                    df_set.loc[df_set['key'].isin([f'user_{n}_pw' for n in nums]), 'value'] = new_password
+                self._sync("settings", old_set, df_set)
+                self.invalidate("settings")
+                registry = self._cached_view("registry")
+                if registry is not None and with_auth: registry.rename(old_id, new_id, new_password)
+        return touched
+
+# --- SQLite ---
+class SQLiteStorage(Storage):
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self._registry = None
+        with self.lock, self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, date_str TEXT NOT NULL, type TEXT NOT NULL,
+                    start_h INTEGER DEFAULT 0, start_m INTEGER DEFAULT 0, end_h INTEGER DEFAULT 0, end_m INTEGER DEFAULT 0,
+                    distance_km REAL DEFAULT 0, pay_amount REAL DEFAULT 0, duration_minutes INTEGER DEFAULT 0);
+                CREATE INDEX IF NOT EXISTS idx_records_user_date ON records (user_id, date_str);
+                CREATE TABLE IF NOT EXISTS settings (user_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT);
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_settings_user_key ON settings (user_id, key);
+            """)
+
+    def _query_df(self, sql, params=()):
+        with self.lock:
+            return pd.read_sql_query(sql, self.db, params=params)
+
+    def read_sheet(self, worksheet, fresh=False):
+        if worksheet == "records": return self._query_df(f"SELECT {', '.join(RECORD_COLUMNS)} FROM records ORDER BY id")
+        if worksheet == "settings": return self._query_df("SELECT user_id, key, value FROM settings ORDER BY rowid")
+        raise KeyError(worksheet)
+
+    def get_records_df(self, user_id, start_date=None, end_date=None):
+        sql = f"SELECT {', '.join(RECORD_COLUMNS)} FROM records WHERE user_id = ?"
+        params = [user_id]
+        if start_date is not None: sql += " AND date_str >= ?"; params.append(start_date)
+        if end_date is not None: sql += " AND date_str <= ?"; params.append(end_date)
+        return compact_records_df(normalize_records_df(self._query_df(sql + " ORDER BY id", params)))
+
+    def get_min_record_date(self, user_id):
+        with self.lock:
+            return self.db.execute("SELECT MIN(date_str) FROM records WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def save_record(self, record_data):
+        cols = [c for c in RECORD_COLUMNS if c != 'id']
+        with self.lock, self.db:
+            cur = self.db.execute(f"INSERT INTO records ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                                  [_sheet_value(record_data.get(c, 0)) for c in cols])
+        record_data['id'] = cur.lastrowid
+        return [(record_data['user_id'], record_data['date_str'])]
+
+    def delete_record(self, record_id):
+        with self.lock, self.db:
+            touched = self.db.execute("SELECT user_id, date_str FROM records WHERE id = ?", (int(record_id),)).fetchall()
+            self.db.execute("DELETE FROM records WHERE id = ?", (int(record_id),))
+        return touched
+
+    def load_settings(self, user_id="common"):
+        with self.lock:
+            return {key: str(value) for key, value in self.db.execute("SELECT key, value FROM settings WHERE user_id = ?", (user_id,))}
+
+    def save_settings(self, user_id, values):
+        with self.lock, self.db:
+            self.db.executemany("INSERT INTO settings (user_id, key, value) VALUES (?, ?, ?) "
+                                "ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value",
+                                [(user_id, key, str(value)) for key, value in values.items()])
+        if self._registry is not None: self._registry.apply_settings(values)
+
+    def user_registry(self):
+        with self.lock:
+            if self._registry is None:
+                rows = self.db.execute("SELECT key, value FROM settings WHERE key LIKE 'user\\_%' ESCAPE '\\' ORDER BY rowid").fetchall()
+                self._registry = UserRegistry((key, str(value)) for key, value in rows)
+            return self._registry
+
+    def update_user_id(self, old_id, new_id, new_password, with_auth=True):
+        with self.lock, self.db:
+            touched = [(old_id, d) for (d,) in self.db.execute("SELECT DISTINCT date_str FROM records WHERE user_id = ?", (old_id,))]
+            self.db.execute("UPDATE records SET user_id = ? WHERE user_id = ?", (new_id, old_id))
+            self.db.execute("UPDATE settings SET user_id = ? WHERE user_id = ?", (new_id, old_id))
+            if with_auth:
+                for (key,) in self.db.execute("SELECT key FROM settings WHERE value = ? AND key LIKE '%\\_id' ESCAPE '\\'", (old_id,)).fetchall():
+                    user_num = key.split('_')[1]
+                    self.db.execute("UPDATE settings SET value = ? WHERE key = ?", (new_id, key))
+                    self.db.execute("UPDATE settings SET value = ? WHERE key = ?", (new_password, f'user_{user_num}_pw'))
+        if self._registry is not None and with_auth: self._registry.rename(old_id, new_id, new_password)
+        return touched
+
+    def archive_year(self, year):
+        # (user_id, date_str) の索引で範囲だけを読むので、年ごとに分ける必要はない (移した行数は常に 0)
+        return 0
@@ -0,0 +1,70 @@
+# 一括計算 (run_batch) の利用者ごとの合計が、締め期間の日ごとの calculate_daily_total の合計と一致するか
+import datetime
+import random
+import pandas as pd
+import pytest
+from payroll import calculate_daily_total, get_closing_period
+from payroll.batch import run_batch
+from storage import SETTING_COLUMNS
+from test_pay_parity import random_day
+
+# 記録のある利用者と、設定だけで記録の無い利用者 (nobody_*) を混ぜる
+def _sheets(seed=0):
+    rng = random.Random(seed)
+    rows, settings = [], []
+    for n in range(7):
+        uid = f"user{n}"
+        for k in range(0, 120, rng.randrange(1, 4)):
+            rows += random_day(rng, uid, (datetime.date(2026, 3, 1) + datetime.timedelta(days=k)).strftime("%Y-%m-%d"))
+        settings += [[uid, 'base_wage', str(rng.randrange(900, 2000, 10))], [uid, 'wage_drive', str(rng.randrange(900, 2000, 10))],
+                     [uid, 'closing_day', str(rng.choice((10, 15, 20, 25, 31)))]]
+    for n in range(3): settings += [[f"nobody_{n}", 'base_wage', '1000'], [f"nobody_{n}", 'closing_day', '20']]
+    settings += [['common', 'user_1_id', 'user0'], ['common', 'user_1_pw', 'pw']]
+    df_rec = pd.DataFrame(rows)
+    df_rec['id'] = range(1, len(df_rec) + 1)
+    return df_rec, pd.DataFrame(settings, columns=SETTING_COLUMNS)
+
+def expected_totals(df_rec, df_set, year, month):
+    conf = {}
+    for uid, key, value in df_set.itertuples(index=False, name=None): conf.setdefault(uid, {})[key] = int(value) if value.isdigit() else value
+    out = {}
+    for uid in sorted((set(df_rec['user_id']) | set(conf)) - {'common'}):
+        c = conf.get(uid, {})
+        s_date, e_date, _ = get_closing_period(year, month, c.get('closing_day', 31))
+        s_str, e_str = s_date.strftime("%Y-%m-%d"), e_date.strftime("%Y-%m-%d")
+        df_user = df_rec[(df_rec['user_id'] == uid) & (df_rec['date_str'] >= s_str) & (df_rec['date_str'] <= e_str)]
+        pay = mins = days = 0
+        for _, day in df_user.groupby('date_str'):
+            p, m = calculate_daily_total(day.to_dict('records'), c.get('base_wage', 1000), c.get('wage_drive', 1000))
+            pay, mins, days = pay + p, mins + m, days + (m > 0)
+        out[uid] = (pay, mins, days)
+    return out
+
+def _totals(df_users):
+    return {u: (p, m, d) for u, p, m, d in df_users[['user_id', 'pay', 'minutes', 'days']].itertuples(index=False, name=None)}
+
+@pytest.mark.parametrize('chunk_size', [3, 200])
+def test_run_batch_matches_daily_totals(chunk_size):
+    df_rec, df_set = _sheets()
+    for month in (3, 4, 5):
+        df_users, df_days = run_batch(df_rec, df_set, 2026, month, workers=1, chunk_size=chunk_size)
+        expected = expected_totals(df_rec, df_set, 2026, month)
+        assert _totals(df_users) == expected
+        assert _totals(df_users)['nobody_0'] == (0, 0, 0)
+        assert int(df_days['pay'].sum()) == sum(p for p, _, _ in expected.values())
+
+def test_run_batch_in_worker_processes():
+    df_rec, df_set = _sheets(seed=1)
+    df_users, _ = run_batch(df_rec, df_set, 2026, 4, workers=2, chunk_size=2)
+    assert _totals(df_users) == expected_totals(df_rec, df_set, 2026, 4)
+
+def test_run_batch_without_records_in_period():
+    # 記録の無い月・記録の無い利用者だけのチャンクでも0円になる
+    df_rec, df_set = _sheets()
+    for chunk_size in (1, 3, 200):
+        df_users, df_days = run_batch(df_rec, df_set, 2030, 1, workers=1, chunk_size=chunk_size)
+        assert len(df_users) == 10
+        assert set(_totals(df_users).values()) == {(0, 0, 0)}
+        assert df_days.empty
+    df_users, _ = run_batch(df_rec.iloc[:0], df_set, 2026, 4, workers=1)
+    assert set(_totals(df_users).values()) == {(0, 0, 0)}
@@ -0,0 +1,70 @@
+# 日別集計キャッシュ (DailySummaryCache) の無効化と、累積和 (ledger) の上限
+import time
+import pandas as pd
+from payroll import DailySummaryCache, summarize_days
+
+def _row(user_id, date_str, start_h=9, end_h=17):
+    return {'id': 0, 'user_id': user_id, 'date_str': date_str, 'type': 'WORK', 'start_h': start_h, 'start_m': 0,
+            'end_h': end_h, 'end_m': 0, 'distance_km': 0, 'pay_amount': 0, 'duration_minutes': (end_h - start_h) * 60}
+
+def _frames():
+    days = ('2026-04-01', '2026-04-02', '2026-04-03')
+    return {uid: pd.DataFrame([_row(uid, d) for d in days]) for uid in ('alice', 'bob')}
+
+def _fill(cache):
+    for uid, df in _frames().items(): summarize_days(df, uid, 1200, 1100, cache)
+    cache.put_ledger(('alice', 1200, 1100, 2026), 'alice-ledger')
+    cache.put_ledger(('bob', 1300, 1100, 2026), 'bob-ledger')
+
+def _days(cache):
+    return sorted((k[0], k[1]) for k in cache.entries)
+
+def test_invalidate_date_drops_only_that_day():
+    # 記録の保存・削除は (user_id, date_str) だけを捨てる
+    cache = DailySummaryCache()
+    _fill(cache)
+    assert len(cache.entries) == 6
+    cache.invalidate('alice', '2026-04-02')
+    assert ('alice', '2026-04-02') not in _days(cache)
+    assert len(_days(cache)) == 5
+    # その利用者の累積和は日別集計から作り直すので捨て、他の利用者の分は残す
+    assert cache.get_ledger(('alice', 1200, 1100, 2026)) is None
+    assert cache.get_ledger(('bob', 1300, 1100, 2026)) == 'bob-ledger'
+    misses = cache.misses
+    for uid, df in _frames().items(): summarize_days(df, uid, 1200, 1100, cache)
+    assert cache.misses == misses + 1
+
+def test_wage_change_drops_only_that_user():
+    cache = DailySummaryCache()
+    _fill(cache)
+    cache.invalidate('alice')
+    assert _days(cache) == [('bob', '2026-04-01'), ('bob', '2026-04-02'), ('bob', '2026-04-03')]
+    assert 'alice' not in cache.user_keys
+    assert cache.get_ledger(('alice', 1200, 1100, 2026)) is None
+    assert cache.get_ledger(('bob', 1300, 1100, 2026)) == 'bob-ledger'
+
+def test_entries_are_bounded():
+    cache = DailySummaryCache(max_entries=4)
+    _fill(cache)
+    assert len(cache.entries) == 4
+    assert sum(len(keys) for keys in cache.user_keys.values()) == 4
+
+def test_ledgers_are_bounded():
+    cache = DailySummaryCache(max_ledgers=3)
+    for year in range(2020, 2026): cache.put_ledger(('alice', 1200, 1100, year), year)
+    assert [k[3] for k in cache.ledgers] == [2023, 2024, 2025]
+    # 使った分は後ろに回り、捨てられにくくなる
+    assert cache.get_ledger(('alice', 1200, 1100, 2023)) == 2023
+    cache.put_ledger(('bob', 1300, 1100, 2026), 2026)
+    assert [k[3] for k in cache.ledgers] == [2025, 2023, 2026]
+    assert cache.stats()['ledgers'] == 3
+
+def test_expired_ledgers_are_pruned():
+    cache = DailySummaryCache()
+    cache.put_ledger(('alice', 1200, 1100, 2025), 'old')
+    time.sleep(0.02)
+    cache.put_ledger(('bob', 1300, 1100, 2026), 'new', ttl=0.01)
+    assert list(cache.ledgers) == [('bob', 1300, 1100, 2026)]
+    time.sleep(0.02)
+    assert cache.get_ledger(('bob', 1300, 1100, 2026), ttl=0.01) is None
+    assert len(cache.ledgers) == 0
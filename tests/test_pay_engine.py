@@ -0,0 +1,112 @@
+# 日をまたぐ規則 (週の閾値・締め期間の残業の上限・週の始まり) と、since からの再計算を PayEngine で確かめる
+import datetime
+import random
+from payroll import PayEngine, PayRules, Record
+from test_pay_parity import random_days
+
+def _work(date_str, start_h, end_h, rtype='WORK'):
+    return Record(0, 'user1', date_str, rtype, start_h * 60, end_h * 60, 0, 0)
+
+def _days(first, n):
+    d = datetime.date.fromisoformat(first)
+    return [(d + datetime.timedelta(days=k)).isoformat() for k in range(n)]
+
+def _six_days():
+    # 2026-04-05 (日) から 04-10 (金) まで 9:00-17:00
+    return [_work(d, 9, 17) for d in _days('2026-04-05', 6)]
+
+WEEKLY = PayRules(weekly_threshold=40 * 60)
+
+# --- 週の閾値 ---
+def test_weekly_threshold_turns_sixth_day_into_overtime():
+    engine = PayEngine(1000, 1000, rules=WEEKLY)
+    engine.run(_six_days())
+    assert [engine.daily[d]['pay'] for d in _days('2026-04-05', 6)] == [8000] * 5 + [10000]
+    assert [engine.daily[d]['over'] for d in _days('2026-04-05', 6)] == [0] * 5 + [480]
+    # 閾値を使わなければ毎日8時間以内なので割増なし
+    default = PayEngine(1000, 1000)
+    default.run(_six_days())
+    assert {v['pay'] for v in default.daily.values()} == {8000}
+
+def test_weekly_threshold_counts_only_normal_minutes():
+    # 1日10時間 x 5日: 毎日2時間は日の閾値で残業になり、週の所定内は8時間ずつ積む
+    engine = PayEngine(1000, 1000, rules=WEEKLY)
+    engine.run([_work(d, 8, 18) for d in _days('2026-04-05', 5)] + [_work('2026-04-10', 9, 11)])
+    assert [engine.daily[d]['over'] for d in _days('2026-04-05', 6)] == [120] * 5 + [120]
+    assert engine.daily['2026-04-10']['pay'] == 2500
+
+def test_week_start_moves_the_week_boundary():
+    # 水曜始まりなら 04-05..07 と 04-08..10 は別の週なので、どちらも40時間に届かない
+    engine = PayEngine(1000, 1000, rules=PayRules(weekly_threshold=40 * 60, week_start=2))
+    engine.run(_six_days())
+    assert {v['pay'] for v in engine.daily.values()} == {8000}
+    assert engine.checkpoints['2026-04-07'].week == '2026-04-01'
+    assert engine.checkpoints['2026-04-08'].week == '2026-04-08'
+    # 月曜始まりなら 04-05 (日) だけが前の週
+    engine = PayEngine(1000, 1000, rules=PayRules(weekly_threshold=40 * 60, week_start=0))
+    engine.run(_six_days())
+    assert {v['pay'] for v in engine.daily.values()} == {8000}
+    assert engine.checkpoints['2026-04-05'].week == '2026-03-30'
+
+# --- 締め期間の残業の上限 ---
+def test_period_overtime_over_threshold_uses_its_multiplier():
+    # 1日10時間 (残業2時間) を続け、締め期間の残業が5時間を超えた分は 1.5倍
+    rules = PayRules(period_overtime_threshold=5 * 60, mult_period_overtime=15000)
+    engine = PayEngine(1000, 1000, closing_day=25, rules=rules)
+    dates = ['2026-04-22', '2026-04-23', '2026-04-24', '2026-04-25', '2026-04-26']
+    engine.run([_work(d, 9, 19) for d in dates])
+    pays = [engine.daily[d]['pay'] for d in dates]
+    # 残業の累計 120 -> 240 -> 360 (60分が上限超え) -> 480 (全部上限超え)、26日から次の締め期間
+    assert pays == [10500, 10500, 8000 + 1250 + 1500, 8000 + 3000, 10500]
+    assert engine.checkpoints['2026-04-25'].period_over == 480
+    assert engine.checkpoints['2026-04-26'].period == '2026-04-26'
+    assert engine.checkpoints['2026-04-26'].period_over == 120
+
+def test_period_overtime_multiplier_combines_with_night():
+    rules = PayRules(period_overtime_threshold=0, mult_period_overtime=15000)
+    engine = PayEngine(1000, 1000, rules=rules)
+    # 14:00-24:00: 22:00 までの8時間は所定内、22:00 からの2時間は上限超えの残業かつ深夜 (1.5 x 1.25)
+    engine.run([_work('2026-04-01', 14, 24)])
+    assert engine.daily['2026-04-01'] == {'pay': 8000 + 3750, 'min': 600, 'over': 120, 'night': 120}
+
+# --- since からの再計算 ---
+def _records(days):
+    return [Record.from_row(r) for _, _, _, recs in days for r in sorted(recs, key=lambda r: r['start_h'])]
+
+def _full(records, rules, closing_day=20):
+    engine = PayEngine(1200, 1100, closing_day=closing_day, rules=rules)
+    engine.run(records)
+    return engine
+
+def test_resume_with_since_matches_full_recompute_for_six_day_week():
+    full = PayEngine(1000, 1000, rules=WEEKLY)
+    full.run(_six_days())
+    engine = PayEngine(1000, 1000, rules=WEEKLY)
+    engine.run(_six_days()[:5])
+    assert engine.run(_six_days()[5:], since='2026-04-10') == ['2026-04-10']
+    assert engine.daily == full.daily
+    # 途中の日を変えても、その前日の状態から同じ結果になる
+    changed = _six_days()
+    changed[1] = _work('2026-04-06', 9, 12)
+    engine.run(changed[1:], since='2026-04-06')
+    expected = PayEngine(1000, 1000, rules=WEEKLY)
+    expected.run(changed)
+    assert engine.daily == expected.daily
+    # 週の合計は43時間になり、最後の日の3時間が残業
+    assert engine.daily['2026-04-10']['pay'] == 5000 + 3750
+
+def test_resume_with_since_matches_full_recompute():
+    rules = PayRules(weekly_threshold=40 * 60, week_start=1, period_overtime_threshold=20 * 60, mult_period_overtime=15000)
+    rng = random.Random(5)
+    days = random_days(seed=6, days=120)
+    engine = _full(_records(days), rules)
+    for _ in range(20):
+        k = rng.randrange(len(days))
+        date_str = days[k][0]
+        days[k] = (date_str, 0, 0, random_days(seed=rng.randrange(1000), days=1)[0][3])
+        for r in days[k][3]: r['date_str'] = date_str
+        redone = engine.run(_records(days[k:]), since=date_str)
+        assert redone == [d for d, _, _, _ in days[k:]]
+        expected = _full(_records(days), rules)
+        assert engine.daily == expected.daily
+        assert engine.dates == expected.dates
@@ -0,0 +1,114 @@
+# 1分ごとのタイムラインで計算していた元の calculate_daily_total (Decimal) を基準にして、
+# 区間で計算する今の calculate_daily_total と一括計算・PayEngine が1円単位で一致するかを確かめる
+import datetime
+import random
+from decimal import Decimal, ROUND_FLOOR
+import pandas as pd
+from payroll import (NIGHT_START, NIGHT_END, OVERTIME_THRESHOLD, Record, PayEngine, calculate_daily_total,
+                     calculate_driving_allowance, calculate_direct_drive_pay, summarize_records_df)
+
+DAYS = 3000
+
+# --- 基準 (区間計算に置き換える前の実装) ---
+def reference_daily_total(records, base_wage, drive_wage):
+    base_wage_dec = Decimal(base_wage)
+    drive_wage_dec = Decimal(drive_wage)
+    timeline = [None] * (48 * 60)
+    fixed_pay = Decimal(0)
+
+    sorted_records = sorted(records, key=lambda x: int(x['start_h']) * 60 + int(x['start_m']))
+
+    for r in sorted_records:
+        try:
+            sh, sm = int(float(r['start_h'])), int(float(r['start_m']))
+            eh, em = int(float(r['end_h'])), int(float(r['end_m']))
+            dist = Decimal(r['distance_km'])
+        except: continue
+
+        if r['type'] == 'OTHER': fixed_pay += Decimal(r['pay_amount'])
+        elif r['type'] == 'DRIVE_DIRECT': fixed_pay += Decimal(calculate_direct_drive_pay(dist))
+        elif r['type'] == 'DRIVE':
+            fixed_pay += Decimal(calculate_driving_allowance(dist))
+            for m in range(sh*60+sm, eh*60+em): timeline[m] = 'DRIVE' if m < len(timeline) else None
+        elif r['type'] == 'WORK':
+            for m in range(sh*60+sm, eh*60+em): timeline[m] = 'WORK' if m < len(timeline) else None
+        elif r['type'] == 'BREAK':
+            for m in range(sh*60+sm, eh*60+em): timeline[m] = 'BREAK' if m < len(timeline) else None
+
+    total_wage_points = Decimal(0)
+    work_mins = 0
+
+    for i, act in enumerate(timeline):
+        if act not in ['WORK', 'DRIVE']: continue
+
+        rate = drive_wage_dec if act == 'DRIVE' else base_wage_dec
+        mult = Decimal(1)
+
+        is_night = (NIGHT_START <= i < NIGHT_END)
+        is_over = (work_mins >= OVERTIME_THRESHOLD)
+
+        if is_night and is_over: mult = Decimal('1.5625')
+        elif is_night or is_over: mult = Decimal('1.25')
+
+        total_wage_points += rate * mult
+        work_mins += 1
+
+    final_pay = (total_wage_points / Decimal(60)).to_integral_value(rounding=ROUND_FLOOR)
+    return int(final_pay + fixed_pay), work_mins
+
+# --- ランダムな日 ---
+# 重なる記録 (後勝ち)・24時をまたぐ勤務・8時間を超える勤務・固定給の記録を混ぜる
+def _row(user_id, date_str, rtype, start, end, km=0, pay=0):
+    return {'id': 0, 'user_id': user_id, 'date_str': date_str, 'type': rtype, 'start_h': start // 60, 'start_m': start % 60,
+            'end_h': end // 60, 'end_m': end % 60, 'distance_km': km, 'pay_amount': pay, 'duration_minutes': max(end - start, 0)}
+
+def random_day(rng, user_id, date_str):
+    rows = []
+    start = rng.randrange(0, 26 * 60)
+    end = min(start + rng.randrange(30, 15 * 60), 33 * 60)
+    rows.append(_row(user_id, date_str, 'WORK', start, end))
+    for _ in range(rng.randrange(0, 5)):
+        rtype = rng.choice(('WORK', 'BREAK', 'DRIVE', 'DRIVE', 'DRIVE_DIRECT', 'OTHER'))
+        if rtype == 'OTHER': rows.append(_row(user_id, date_str, rtype, 0, 0, pay=rng.choice((-3000, -500, 500, 1000, 3000))))
+        elif rtype == 'DRIVE_DIRECT': rows.append(_row(user_id, date_str, rtype, 0, 0, km=rng.randrange(0, 300)))
+        else:
+            s = rng.randrange(max(start - 120, 0), max(end, start + 1))
+            e = min(s + rng.randrange(1, 8 * 60), 33 * 60)
+            rows.append(_row(user_id, date_str, rtype, s, e, km=rng.randrange(0, 400) if rtype == 'DRIVE' else 0))
+    rng.shuffle(rows)
+    return rows
+
+def random_days(seed=0, days=DAYS):
+    # (日付, 基本時給, 運転時給, 記録) のリスト。日付は1人分の連続した日
+    rng = random.Random(seed)
+    first = datetime.date(2025, 1, 1)
+    out = []
+    for k in range(days):
+        date_str = (first + datetime.timedelta(days=k)).strftime("%Y-%m-%d")
+        out.append((date_str, rng.randrange(900, 2000, 10), rng.randrange(900, 2000, 10), random_day(rng, "user1", date_str)))
+    return out
+
+# --- テスト ---
+def test_calculate_daily_total_matches_reference():
+    mismatches = [(date_str, recs) for date_str, base, drive, recs in random_days(seed=1)
+                  if calculate_daily_total(recs, base, drive) != reference_daily_total(recs, base, drive)]
+    assert mismatches == []
+
+def test_calculate_daily_total_accepts_records():
+    for date_str, base, drive, recs in random_days(seed=2, days=300):
+        assert calculate_daily_total([Record.from_row(r) for r in recs], base, drive) == reference_daily_total(recs, base, drive)
+
+def test_summarize_records_df_matches_reference():
+    # 日ごとの時給を base_wage / wage_drive 列で渡す (一括計算と同じ使い方)
+    days = random_days(seed=3)
+    df = pd.DataFrame([dict(r, base_wage=base, wage_drive=drive) for _, base, drive, recs in days for r in recs])
+    daily = summarize_records_df(df, 0, 0)
+    for date_str, base, drive, recs in days:
+        assert (int(daily.at[date_str, 'pay']), int(daily.at[date_str, 'min'])) == reference_daily_total(recs, base, drive), date_str
+
+def test_pay_engine_default_rules_matches_reference():
+    days = random_days(seed=4)
+    engine = PayEngine(1200, 1100, closing_day=25)
+    engine.run([Record.from_row(r) for _, _, _, recs in days for r in recs])
+    for date_str, _, _, recs in days:
+        assert (engine.daily[date_str]['pay'], engine.daily[date_str]['min']) == reference_daily_total(recs, 1200, 1100), date_str
@@ -0,0 +1,79 @@
+# シートのスナップショット (SnapshotStore) を一時ディレクトリに置き、GSheetsStorage.load_sheet から使う
+import logging
+import os
+import pandas as pd
+from bench.fakes import MemoryConnection
+from snapshots import SnapshotStore
+from storage import GSheetsStorage, RECORD_COLUMNS, SETTING_COLUMNS
+
+def _sheets():
+    records = pd.DataFrame([{'id': 1, 'user_id': 'alice', 'date_str': '2026-04-01', 'type': 'WORK', 'start_h': 9, 'start_m': 0,
+                             'end_h': 17, 'end_m': 0, 'distance_km': 0, 'pay_amount': 0, 'duration_minutes': 480}], columns=RECORD_COLUMNS)
+    settings = pd.DataFrame([['common', 'user_1_id', 'alice'], ['common', 'user_1_pw', '1234']], columns=SETTING_COLUMNS)
+    return {'records': records, 'settings': settings}
+
+def _storage(conn, directory):
+    return GSheetsStorage(conn, snapshots=SnapshotStore(str(directory)))
+
+def test_unchanged_revision_is_read_from_disk(tmp_path):
+    conn = MemoryConnection(_sheets())
+    first = _storage(conn, tmp_path)
+    df = first.load_sheet("records")
+    assert first.snapshots.stats() == {'hits': 0, 'misses': 1, 'failures': 0}
+    assert os.path.exists(tmp_path / "records.parquet")
+    # 再起動した後の別のインスタンスでも、版が同じならシートを取りに行かない
+    reads = conn.calls['read']
+    second = _storage(conn, tmp_path)
+    pd.testing.assert_frame_equal(second.load_sheet("records"), df, check_dtype=False)
+    assert second.load_sheet("settings")['value'].tolist() == ['alice', '1234']
+    assert second.snapshots.stats()['hits'] == 1
+    assert conn.calls['read'] == reads + 1
+
+def test_write_discards_the_snapshot(tmp_path):
+    conn = MemoryConnection(_sheets())
+    storage = _storage(conn, tmp_path)
+    storage.load_sheet("records")
+    storage.save_record({'user_id': 'bob', 'date_str': '2026-04-02', 'type': 'WORK', 'start_h': 9, 'start_m': 0,
+                         'end_h': 12, 'end_m': 0, 'distance_km': 0, 'pay_amount': 0, 'duration_minutes': 180})
+    assert not os.path.exists(tmp_path / "records.parquet")
+    reads, misses = conn.calls['read'], storage.snapshots.stats()['misses']
+    df = storage.load_sheet("records")
+    assert pd.to_numeric(df['id']).tolist() == [1, 2]
+    assert storage.snapshots.stats()['misses'] == misses + 1
+    assert conn.calls['read'] == reads + 1
+
+def test_other_spreadsheet_is_a_miss(tmp_path):
+    # 最終更新時刻が同じでも、別のスプレッドシートのスナップショットは使わない
+    _storage(MemoryConnection(_sheets()), tmp_path).load_sheet("records")
+    sheets = _sheets()
+    sheets['records'] = sheets['records'].assign(user_id='carol')
+    other = MemoryConnection(sheets)
+    storage = _storage(other, tmp_path)
+    assert storage.load_sheet("records")['user_id'].tolist() == ['carol']
+    assert storage.snapshots.stats() == {'hits': 0, 'misses': 1, 'failures': 0}
+    assert other.calls['read'] == 1
+
+def test_fresh_read_never_touches_disk(tmp_path):
+    conn = MemoryConnection(_sheets())
+    storage = _storage(conn, tmp_path / "snapshots")
+    storage.read_sheet("records", fresh=True)
+    # 版も取らず、ディレクトリも作らない
+    assert not os.path.exists(tmp_path / "snapshots")
+    assert 'revision' not in conn.calls
+    # 古いスナップショットがあっても、書き込み前の読み直しはシートから取る
+    storage.load_sheet("records")
+    conn.sheets['records'] = conn.sheets['records'].assign(user_id='bob')
+    assert storage.read_sheet("records", fresh=True)['user_id'].tolist() == ['bob']
+    assert storage.snapshots.stats() == {'hits': 0, 'misses': 1, 'failures': 0}
+    assert conn.calls['revision'] == 1
+
+def test_save_failure_is_counted_and_logged(tmp_path, caplog):
+    blocked = tmp_path / "blocked"
+    blocked.write_text("")
+    conn = MemoryConnection(_sheets())
+    storage = _storage(conn, blocked)
+    with caplog.at_level(logging.WARNING, logger="salary.snapshots"):
+        assert storage.load_sheet("records")['user_id'].tolist() == ['alice']
+    assert storage.snapshots.stats() == {'hits': 0, 'misses': 1, 'failures': 1}
+    assert "records" in caplog.text
+    assert os.listdir(tmp_path) == ["blocked"]
@@ -0,0 +1,337 @@
+# GSheetsStorage をメモリ上の接続 (bench.fakes.MemoryConnection) で動かす。
+# 行単位の書き込み (client._select_worksheet がある接続) と、シート全体の書き直し (client = None) の両方を試す
+import threading
+import pandas as pd
+import pytest
+from bench.fakes import MemoryConnection, MemoryWorksheet
+from storage import GSheetsStorage, WriteQueue, MANIFEST_SHEET, RECORD_COLUMNS, SETTING_COLUMNS
+
+def _record(rid, user_id, date_str, start_h=9, end_h=17, rtype='WORK'):
+    return {'id': rid, 'user_id': user_id, 'date_str': date_str, 'type': rtype, 'start_h': start_h, 'start_m': 0,
+            'end_h': end_h, 'end_m': 0, 'distance_km': 0, 'pay_amount': 0, 'duration_minutes': (end_h - start_h) * 60}
+
+def _sheets():
+    records = pd.DataFrame([_record(1, 'alice', '2026-04-01'), _record(2, 'bob', '2026-04-01'),
+                            _record(3, 'alice', '2026-04-02'), _record(4, 'bob', '2026-04-03')], columns=RECORD_COLUMNS)
+    settings = pd.DataFrame([['common', 'user_1_id', 'alice'], ['common', 'user_1_pw', 'pa'],
+                             ['common', 'user_2_id', 'bob'], ['common', 'user_2_pw', 'pb'],
+                             ['alice', 'base_wage', '1200'], ['bob', 'base_wage', '1300']], columns=SETTING_COLUMNS)
+    return {'records': records, 'settings': settings}
+
+@pytest.fixture(params=['rows', 'rewrite'])
+def conn(request):
+    conn = MemoryConnection(_sheets())
+    if request.param == 'rewrite': conn.client = None
+    return conn
+
+def _records(conn):
+    df = conn.sheets['records']
+    return df.assign(id=pd.to_numeric(df['id']).astype(int))
+
+def _bob(conn):
+    df = _records(conn)
+    return df[df['user_id'] == 'bob'].astype(str).reset_index(drop=True)
+
+def test_save_record_appends_row(conn):
+    storage = GSheetsStorage(conn)
+    bob = _bob(conn)
+    rec = _record(0, 'alice', '2026-04-05', 8, 12)
+    del rec['id']
+    assert storage.save_record(rec) == [('alice', '2026-04-05')]
+    df = _records(conn)
+    assert len(df) == 5
+    assert rec['id'] == 5
+    added = df[df['id'] == 5].iloc[0]
+    assert (added['user_id'], added['date_str'], int(added['start_h']), int(added['end_h'])) == ('alice', '2026-04-05', 8, 12)
+    assert df['id'].is_unique
+    assert _bob(conn).equals(bob)
+    assert [r.start for r in storage.get_records_by_date('alice', '2026-04-05')] == [8 * 60]
+    # 行単位の接続では追記だけ、そうでなければ全体の書き直しになっている
+    assert ('append_rows' in conn.calls, 'update' in conn.calls) == ((True, False) if conn.client else (False, True))
+
+def test_save_records_get_unique_ids(conn):
+    storage = GSheetsStorage(conn)
+    for k in range(5):
+        storage.save_record({k: v for k, v in _record(0, 'alice', f"2026-04-1{k}").items() if k != 'id'})
+    df = _records(conn)
+    assert len(df) == 9
+    assert df['id'].is_unique
+    assert sorted(df['id']) == list(range(1, 10))
+
+def test_delete_record_removes_only_that_row(conn):
+    storage = GSheetsStorage(conn)
+    bob = _bob(conn)
+    assert storage.delete_record(3) == [('alice', '2026-04-02')]
+    df = _records(conn)
+    assert sorted(df['id']) == [1, 2, 4]
+    assert _bob(conn).equals(bob)
+    assert storage.get_records_by_date('alice', '2026-04-02') == []
+    assert ('delete_rows' in conn.calls, 'update' in conn.calls) == ((True, False) if conn.client else (False, True))
+
+def test_delete_then_save_keeps_ids_unique(conn):
+    storage = GSheetsStorage(conn)
+    storage.delete_record(2)
+    rec = {k: v for k, v in _record(0, 'bob', '2026-04-06').items() if k != 'id'}
+    storage.save_record(rec)
+    df = _records(conn)
+    assert df['id'].is_unique
+    assert sorted(df['id']) == [1, 3, 4, 5]
+    assert sorted(df.loc[df['user_id'] == 'alice', 'id']) == [1, 3]
+
+def test_concurrent_settings_saves_are_not_lost(conn):
+    # 読み直しと書き込みの間に遅延を入れ、同時に保存しても全員の値が残ることを確かめる
+    conn.latency = 0.02
+    storage = GSheetsStorage(conn)
+    threads = [threading.Thread(target=storage.save_settings, args=(f"user{n}", {'base_wage': 1000 + n, 'closing_day': 25}))
+               for n in range(10)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    conn.latency = 0
+    for n in range(10):
+        assert storage.load_settings(f"user{n}") == {'base_wage': str(1000 + n), 'closing_day': '25'}
+    assert storage.load_settings('alice') == {'base_wage': '1200'}
+
+# --- 空行のあるシート ---
+# GSheetsConnection.read (gspread_dataframe) は空行を読み飛ばすので、DataFrame の位置とシートの行がずれる
+class BlankRowConnection(MemoryConnection):
+    def read(self, worksheet=None, ttl=None, **kwargs):
+        return super().read(worksheet=worksheet, ttl=ttl, **kwargs).dropna(how='all').reset_index(drop=True)
+
+def _with_blank_row(df, at):
+    blank = pd.DataFrame([[None] * len(df.columns)], columns=df.columns)
+    return pd.concat([df.iloc[:at], blank, df.iloc[at:]], ignore_index=True)
+
+def test_rename_with_blank_row_keeps_rows_aligned():
+    sheets = _sheets()
+    sheets['records'] = _with_blank_row(sheets['records'], 2)
+    conn = BlankRowConnection(sheets)
+    storage = GSheetsStorage(conn)
+    storage.update_user_id('alice', 'alicia', 'pw2')
+    df = conn.sheets['records'].dropna(how='all')
+    users = dict(zip(pd.to_numeric(df['id']).astype(int), df['user_id']))
+    assert users == {1: 'alicia', 2: 'bob', 3: 'alicia', 4: 'bob'}
+    # ずれた範囲に書かず、記録シート全体を書き直している (空行も無くなる)
+    assert len(conn.sheets['records']) == 4
+
+def test_save_settings_with_blank_row_updates_the_right_row():
+    sheets = _sheets()
+    sheets['settings'] = _with_blank_row(sheets['settings'], 1)
+    conn = BlankRowConnection(sheets)
+    storage = GSheetsStorage(conn)
+    storage.save_settings('bob', {'base_wage': 1350})
+    df = conn.sheets['settings'].dropna(how='all')
+    values = {(u, k): v for u, k, v in df.itertuples(index=False, name=None)}
+    assert values[('bob', 'base_wage')] == '1350'
+    assert values[('alice', 'base_wage')] == '1200'
+    assert values[('common', 'user_1_pw')] == 'pa'
+    assert storage.user_registry().check('alice', 'pa')
+
+def test_rename_without_blank_rows_sends_only_changed_cells(conn):
+    storage = GSheetsStorage(conn)
+    storage.update_user_id('alice', 'alicia', 'pw2')
+    users = dict(zip(_records(conn)['id'], conn.sheets['records']['user_id']))
+    assert users == {1: 'alicia', 2: 'bob', 3: 'alicia', 4: 'bob'}
+    assert ('batch_update' in conn.calls, 'update' in conn.calls) == ((True, False) if conn.client else (False, True))
+
+# --- 書き込みキュー (グループコミット) ---
+def _blocking_queue():
+    # 最初のまとまりの書き込みを止めておき、その間に来た要求がどうまとまるかを見る
+    batches, entered, release = [], threading.Event(), threading.Event()
+    def commit(ops):
+        batches.append(list(ops))
+        entered.set()
+        release.wait(5)
+        if any(op == 'fail' for op in ops): raise RuntimeError("write failed")
+        return [op * 10 for op in ops]
+    return WriteQueue(commit), batches, entered, release
+
+def _start(queue, ops, results):
+    def run(op):
+        try: results[op] = queue.submit(op)
+        except Exception as e: results[op] = e
+    threads = [threading.Thread(target=run, args=(op,)) for op in ops]
+    for t in threads: t.start()
+    return threads
+
+def _wait_pending(queue, n):
+    for _ in range(500):
+        with queue.lock:
+            if queue.pending is not None and len(queue.pending.ops) == n: return
+        threading.Event().wait(0.01)
+    raise AssertionError("requests did not queue")
+
+def test_requests_during_a_write_go_in_one_batch():
+    queue, batches, entered, release = _blocking_queue()
+    results = {}
+    threads = _start(queue, [0], results)
+    assert entered.wait(5)
+    threads += _start(queue, range(1, 9), results)
+    _wait_pending(queue, 8)
+    release.set()
+    for t in threads: t.join()
+    assert [sorted(b) for b in batches] == [[0], list(range(1, 9))]
+    assert results == {op: op * 10 for op in range(9)}
+    assert (queue.batches, queue.ops) == (2, 9)
+
+def test_write_error_reaches_every_waiter():
+    queue, batches, entered, release = _blocking_queue()
+    results = {}
+    threads = _start(queue, [0], results)
+    assert entered.wait(5)
+    threads += _start(queue, [1, 2, 'fail', 3], results)
+    _wait_pending(queue, 4)
+    release.set()
+    for t in threads: t.join()
+    assert results[0] == 0
+    assert all(isinstance(results[op], RuntimeError) for op in (1, 2, 'fail', 3))
+    # 失敗したまとまりの後も次の要求は書ける
+    assert queue.submit(4) == 40
+    assert queue.batches == 3
+
+def test_concurrent_saves_get_unique_ids(conn):
+    conn.latency = 0.01
+    storage = GSheetsStorage(conn)
+    threads = [threading.Thread(target=storage.save_record, args=({k: v for k, v in _record(0, f"user{n % 3}", f"2026-05-{n + 1:02}").items() if k != 'id'},))
+               for n in range(20)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    conn.latency = 0
+    df = _records(conn)
+    assert sorted(df['id']) == list(range(1, 25))
+    assert storage.writes.ops == 20
+    assert storage.writes.batches < 20
+    assert _bob(conn).equals(_bob(MemoryConnection(_sheets())))
+
+def test_failed_row_write_is_not_rewritten(monkeypatch):
+    # 追記がシートに届いた後でエラーになっても、全体の書き直しで同じ記録を足さない
+    conn = MemoryConnection(_sheets())
+    append_rows = MemoryWorksheet.append_rows
+    def flaky(self, values, value_input_option=None):
+        append_rows(self, values, value_input_option)
+        raise TimeoutError("append_rows")
+    monkeypatch.setattr(MemoryWorksheet, 'append_rows', flaky)
+    storage = GSheetsStorage(conn)
+    with pytest.raises(TimeoutError):
+        storage.save_record({k: v for k, v in _record(0, 'alice', '2026-04-05').items() if k != 'id'})
+    assert sorted(_records(conn)['id']) == [1, 2, 3, 4, 5]
+    assert 'update' not in conn.calls
+
+def test_rewrite_when_id_header_is_missing(monkeypatch):
+    conn = MemoryConnection(_sheets())
+    monkeypatch.setattr(MemoryWorksheet, 'col_values', lambda self, col: [])
+    storage = GSheetsStorage(conn)
+    storage.save_record({k: v for k, v in _record(0, 'alice', '2026-04-05').items() if k != 'id'})
+    assert sorted(_records(conn)['id']) == [1, 2, 3, 4, 5]
+    assert 'update' in conn.calls and 'append_rows' not in conn.calls
+
+# --- 年ごとのパーティション ---
+# 2024・2025年の記録をアーカイブしてから読む。id 9 は後から入力した2025年の記録 (records の残りより大きい id)
+def _years():
+    rows = [_record(1, 'alice', '2024-03-01'), _record(2, 'bob', '2024-11-30'), _record(3, 'alice', '2024-12-31', 18, 22),
+            _record(4, 'alice', '2025-01-05'), _record(5, 'bob', '2025-06-01'), _record(6, 'alice', '2026-01-02'),
+            _record(7, 'bob', '2026-02-01'), _record(8, 'alice', '2026-02-03'), _record(9, 'alice', '2025-12-20')]
+    sheets = _sheets()
+    sheets['records'] = pd.DataFrame(rows, columns=RECORD_COLUMNS)
+    return sheets
+
+@pytest.fixture(params=['rows', 'rewrite'])
+def years(request):
+    conn = MemoryConnection(_years())
+    if request.param == 'rewrite': conn.client = None
+    return conn
+
+def _ids(df):
+    return sorted(pd.to_numeric(df['id']).astype(int))
+
+def _manifest(conn):
+    df = conn.sheets[MANIFEST_SHEET]
+    return {(p, u): (f, l, int(m)) for p, u, f, l, m in df.astype({'max_id': int}).astype(str).itertuples(index=False, name=None)}
+
+RANGES = [(None, None), ('2024-12-01', '2025-01-31'), ('2025-12-01', '2026-01-31'), ('2026-01-01', None), ('2023-01-01', '2023-12-31')]
+
+def _reads(storage, user_id):
+    frames = [storage.get_records_df(user_id, a, b).reset_index(drop=True) for a, b in RANGES]
+    by_date = {d: [r.id for r in storage.get_records_by_date(user_id, d)] for d in ('2024-12-31', '2025-12-20', '2026-02-03')}
+    return frames, by_date, [(r.id, r.date_str) for r in storage.get_records_by_user(user_id)], storage.get_min_record_date(user_id)
+
+def _same_reads(a, b):
+    assert len(a[0]) == len(b[0])
+    for x, y in zip(a[0], b[0]): pd.testing.assert_frame_equal(x, y, check_dtype=False)
+    assert a[1:] == b[1:]
+
+def test_archive_moves_rows_and_writes_manifest(years):
+    storage = GSheetsStorage(years)
+    assert storage.archive_year(2024) == 3
+    assert storage.archive_year(2025) == 3
+    assert _ids(years.sheets['records']) == [6, 7, 8]
+    assert _ids(years.sheets['records_2024']) == [1, 2, 3]
+    assert _ids(years.sheets['records_2025']) == [4, 5, 9]
+    assert _manifest(years) == {('records_2024', 'alice'): ('2024-03-01', '2024-12-31', 3), ('records_2024', 'bob'): ('2024-11-30', '2024-11-30', 2),
+                                ('records_2025', 'alice'): ('2025-01-05', '2025-12-20', 9), ('records_2025', 'bob'): ('2025-06-01', '2025-06-01', 5)}
+    assert storage.archive_year(2023) == 0
+    assert storage.manifest().partitions_of('alice', '2024-12-01', '2025-01-31') == ['records_2024', 'records_2025']
+
+def test_reads_after_archive_match_before(years):
+    before = {uid: _reads(GSheetsStorage(MemoryConnection(_years())), uid) for uid in ('alice', 'bob', 'carol')}
+    storage = GSheetsStorage(years)
+    storage.archive_year(2024)
+    storage.archive_year(2025)
+    for s in (storage, GSheetsStorage(years)):
+        for uid in ('alice', 'bob', 'carol'): _same_reads(_reads(s, uid), before[uid])
+    # 範囲に重ならないパーティションは読まない
+    fresh = GSheetsStorage(years)
+    fresh.get_records_df('alice', '2026-01-01')
+    assert 'records_2024' not in fresh._views and 'records_2025' not in fresh._views
+
+def test_new_ids_stay_above_manifest_max_id(years):
+    GSheetsStorage(years).archive_year(2025)
+    # records に残る最大の id は 8 だが、アーカイブした 9 は使わない
+    storage = GSheetsStorage(years)
+    rec = {k: v for k, v in _record(0, 'bob', '2026-03-01').items() if k != 'id'}
+    storage.save_record(rec)
+    assert rec['id'] == 10
+    assert _ids(years.sheets['records']) == [1, 2, 3, 6, 7, 8, 10]
+
+def test_rename_across_partitions(years):
+    storage = GSheetsStorage(years)
+    storage.archive_year(2024)
+    storage.archive_year(2025)
+    alice = _reads(storage, 'alice')
+    touched = storage.update_user_id('alice', 'alicia', 'pw2')
+    assert sorted(touched) == [('alice', d) for d in ('2024-03-01', '2024-12-31', '2025-01-05', '2025-12-20', '2026-01-02', '2026-02-03')]
+    for name in ('records', 'records_2024', 'records_2025'):
+        assert 'alice' not in set(years.sheets[name]['user_id'])
+    assert {u for _, u in _manifest(years)} == {'alicia', 'bob'}
+    for s in (storage, GSheetsStorage(years)):
+        renamed = _reads(s, 'alicia')
+        assert [(i, d) for i, d in renamed[2]] == alice[2]
+        assert renamed[3] == alice[3] == '2024-03-01'
+        assert s.get_records_by_user('alice') == []
+
+def test_delete_archived_record(years):
+    storage = GSheetsStorage(years)
+    storage.archive_year(2024)
+    storage.archive_year(2025)
+    # 表示した (読み込んだ) アーカイブの記録を消す
+    assert [r.id for r in storage.get_records_by_date('alice', '2025-12-20')] == [9]
+    assert storage.delete_record(9) == [('alice', '2025-12-20')]
+    assert _ids(years.sheets['records_2025']) == [4, 5]
+    assert _ids(years.sheets['records']) == [6, 7, 8]
+    assert storage.get_records_by_date('alice', '2025-12-20') == []
+    assert GSheetsStorage(years).get_records_by_date('alice', '2025-12-20') == []
+    assert ('delete_rows' in years.calls) == bool(years.client)
+
+def test_rearchive_year_merges_late_records(years):
+    storage = GSheetsStorage(years)
+    storage.archive_year(2025)
+    # アーカイブ後に2025年の記録を足してもう一度アーカイブする
+    rec = {k: v for k, v in _record(0, 'bob', '2025-12-28').items() if k != 'id'}
+    storage.save_record(rec)
+    assert storage.get_records_by_date('bob', '2025-12-28')[0].id == rec['id'] == 10
+    assert storage.archive_year(2025) == 1
+    assert _ids(years.sheets['records_2025']) == [4, 5, 9, 10]
+    assert _ids(years.sheets['records']) == [1, 2, 3, 6, 7, 8]
+    manifest = _manifest(years)
+    assert [k for k in manifest if k[0] == 'records_2025'] == [('records_2025', 'alice'), ('records_2025', 'bob')]
+    assert manifest[('records_2025', 'bob')] == ('2025-06-01', '2025-12-28', 10)
+    assert [r.id for r in GSheetsStorage(years).get_records_by_user('bob')] == [2, 5, 10, 7]
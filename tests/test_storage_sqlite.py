@@ -0,0 +1,80 @@
+# SQLiteStorage を一時ファイルのデータベースで動かす
+import pytest
+from storage import SQLiteStorage
+
+def _record(user_id, date_str, start_h=9, end_h=17, rtype='WORK'):
+    return {'user_id': user_id, 'date_str': date_str, 'type': rtype, 'start_h': start_h, 'start_m': 0,
+            'end_h': end_h, 'end_m': 0, 'distance_km': 0, 'pay_amount': 0, 'duration_minutes': (end_h - start_h) * 60}
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "salary.db"))
+    for rec in (_record('alice', '2026-04-02'), _record('bob', '2026-04-01'), _record('alice', '2026-04-01', 18, 22)):
+        storage.save_record(rec)
+    storage.save_settings('common', {'user_1_id': 'alice', 'user_1_pw': 'pa', 'user_2_id': 'bob', 'user_2_pw': 'pb'})
+    storage.save_settings('alice', {'base_wage': 1200, 'wage_drive': 1100})
+    yield storage
+    storage.db.close()
+
+def test_save_record_assigns_ids(storage):
+    rec = _record('alice', '2026-04-03')
+    assert storage.save_record(rec) == [('alice', '2026-04-03')]
+    assert rec['id'] == 4
+    assert list(storage.read_sheet("records")['id']) == [1, 2, 3, 4]
+
+def test_get_records_by_date(storage):
+    recs = storage.get_records_by_date('alice', '2026-04-01')
+    assert [(r.id, r.user_id, r.date_str, r.type, r.start, r.end) for r in recs] == [(3, 'alice', '2026-04-01', 'WORK', 18 * 60, 22 * 60)]
+    assert storage.get_records_by_date('alice', '2026-04-05') == []
+    assert [r.id for r in storage.get_records_by_user('alice')] == [1, 3]
+
+def test_min_record_date(storage):
+    assert storage.get_min_record_date('alice') == '2026-04-01'
+    assert storage.get_min_record_date('carol') is None
+
+def test_delete_record(storage):
+    assert storage.delete_record(3) == [('alice', '2026-04-01')]
+    assert storage.get_records_by_date('alice', '2026-04-01') == []
+    assert storage.get_min_record_date('alice') == '2026-04-02'
+    assert [r.id for r in storage.get_records_by_date('bob', '2026-04-01')] == [2]
+    assert storage.delete_record(99) == []
+
+def test_save_settings_upserts(storage):
+    storage.save_settings('alice', {'base_wage': 1250, 'closing_day': 25})
+    assert storage.load_settings('alice') == {'base_wage': '1250', 'wage_drive': '1100', 'closing_day': '25'}
+    df = storage.read_sheet("settings")
+    assert len(df[(df['user_id'] == 'alice') & (df['key'] == 'base_wage')]) == 1
+    assert storage.load_settings('bob') == {}
+
+def test_save_settings_updates_registry(storage):
+    users = storage.user_registry()
+    assert users.check('alice', 'pa')
+    storage.save_settings('common', {'user_1_pw': 'new'})
+    assert storage.user_registry().check('alice', 'new')
+    assert not storage.user_registry().check('alice', 'pa')
+
+def test_update_user_id_with_auth(storage):
+    users = storage.user_registry()
+    touched = storage.update_user_id('alice', 'alicia', 'pw2', with_auth=True)
+    assert sorted(touched) == [('alice', '2026-04-01'), ('alice', '2026-04-02')]
+    assert [r.id for r in storage.get_records_by_user('alicia')] == [1, 3]
+    assert storage.get_records_by_user('alice') == []
+    assert [r.id for r in storage.get_records_by_user('bob')] == [2]
+    assert storage.load_settings('alicia') == {'base_wage': '1200', 'wage_drive': '1100'}
+    assert storage.load_settings('common')['user_1_id'] == 'alicia'
+    assert storage.load_settings('common')['user_1_pw'] == 'pw2'
+    assert storage.load_settings('common')['user_2_pw'] == 'pb'
+    assert users.check('alicia', 'pw2') and 'alice' not in users
+
+def test_update_user_id_without_auth(storage):
+    storage.update_user_id('alice', 'alicia', 'pw2', with_auth=False)
+    assert [r.id for r in storage.get_records_by_user('alicia')] == [1, 3]
+    assert storage.load_settings('alicia') == {'base_wage': '1200', 'wage_drive': '1100'}
+    # アカウント行はそのまま
+    assert storage.load_settings('common')['user_1_id'] == 'alice'
+    assert storage.load_settings('common')['user_1_pw'] == 'pa'
+    assert storage.user_registry().check('alice', 'pa')
+
+def test_archive_year_is_a_no_op(storage):
+    assert storage.archive_year(2026) == 0
+    assert [r.id for r in storage.get_records_by_user('alice')] == [1, 3]
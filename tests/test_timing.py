@@ -0,0 +1,89 @@
+# 再実行ごとの計測 (RerunTimings) に、別スレッドで読んだシートも数えられるか
+import threading
+import pandas as pd
+from bench.fakes import MemoryConnection
+from storage import GSheetsStorage, SETTING_COLUMNS
+from timing import RerunTimings, TimedConnection
+
+def _conn():
+    records = pd.DataFrame([{'id': 1, 'user_id': 'alice', 'date_str': '2026-04-01', 'type': 'WORK', 'start_h': 9, 'start_m': 0,
+                             'end_h': 17, 'end_m': 0, 'distance_km': 0, 'pay_amount': 0, 'duration_minutes': 480}])
+    settings = pd.DataFrame([['common', 'user_1_id', 'alice'], ['common', 'user_1_pw', 'pa']], columns=SETTING_COLUMNS)
+    return MemoryConnection({'records': records, 'settings': settings})
+
+def test_load_snapshot_reads_are_timed():
+    timings = RerunTimings(enabled=True)
+    storage = GSheetsStorage(TimedConnection(_conn(), timings))
+    timings.begin(user='alice')
+    storage.load_snapshot()
+    line = timings.end(user='alice')
+    assert line['ops']['sheet.read:records'] == {'n': 1, 'ms': line['ops']['sheet.read:records']['ms'], 'rows': 1}
+    assert line['ops']['sheet.read:settings']['rows'] == 2
+
+def test_reads_are_counted_in_the_callers_rerun():
+    # 2つのセッションが同時に計測していても、読み込みはそれぞれの再実行に数える
+    timings = RerunTimings(enabled=True)
+    conn = _conn()
+    lines = {}
+    ready = threading.Barrier(2)
+    def session(user, worksheet):
+        storage = GSheetsStorage(TimedConnection(conn, timings))
+        timings.begin(user=user)
+        ready.wait()
+        storage.load_snapshot((worksheet,))
+        lines[user] = timings.end()
+    threads = [threading.Thread(target=session, args=args) for args in (('alice', 'records'), ('bob', 'settings'))]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert set(lines['alice']['ops']) == {'sheet.read:records'}
+    assert set(lines['bob']['ops']) == {'sheet.read:settings'}
+    assert timings.reruns == 2
+
+def test_nothing_is_recorded_outside_a_rerun():
+    timings = RerunTimings(enabled=True)
+    GSheetsStorage(TimedConnection(_conn(), timings)).load_snapshot()
+    assert timings.end() is None
+    assert timings.history == {}
+
+# --- fragment だけの再実行 ---
+def test_fragment_rerun_is_timed_on_its_own():
+    timings = RerunTimings(enabled=True)
+    storage = GSheetsStorage(TimedConnection(_conn(), timings))
+
+    @timings.rerun(lambda: {'user': 'alice'})
+    def record_tab():
+        with timings.span("calc.daily_total"): pass
+        return storage.get_records_by_date('alice', '2026-04-01')
+
+    # スクリプト全体の再実行が終わった後に、タブの中だけが再実行される
+    timings.begin(user='alice')
+    timings.end(user='alice')
+    assert [r.id for r in record_tab()] == [1]
+    assert timings.reruns == 2
+    assert timings.current.get() is None
+    assert set(timings.history) >= {'calc.daily_total', 'sheet.read:records', 'rerun'}
+
+def test_fragment_inside_a_full_rerun_is_counted_once():
+    timings = RerunTimings(enabled=True)
+
+    @timings.rerun()
+    def calendar_tab():
+        with timings.span("render.calendar"): pass
+
+    timings.begin(user='alice')
+    calendar_tab()
+    line = timings.end(user='alice')
+    assert set(line['ops']) == {'render.calendar'}
+    assert timings.reruns == 1
+
+def test_fragment_rerun_is_closed_when_it_raises():
+    timings = RerunTimings(enabled=True)
+
+    @timings.rerun()
+    def settings_tab():
+        with timings.span("settings.save"): raise RuntimeError("rerun")
+
+    try: settings_tab()
+    except RuntimeError: pass
+    assert timings.current.get() is None
+    assert timings.reruns == 1
@@ -0,0 +1,99 @@
+# ユーザー台帳 (UserRegistry) を、設定シートの行ごとにシート全体を探していた元の load_auth_users と比べる。
+# GSheets バックエンドで保存・ID変更したときに、共有している台帳がその場で更新されるかも確かめる
+import random
+import pandas as pd
+import pytest
+from bench.fakes import MemoryConnection
+from storage import GSheetsStorage, UserRegistry, account_rows, SETTING_COLUMNS, RECORD_COLUMNS
+
+# --- 基準 (台帳を作る前の実装) ---
+def reference_auth_users(df):
+    auth_users = {"admin": "admin"}
+    user_rows = df[df['key'].str.endswith('_id')]
+    for _, row in user_rows.iterrows():
+        user_num = row['key'].split('_')[1]
+        user_id = row['value']
+        pw_rows = df[df['key'] == f'user_{user_num}_pw']
+        if not pw_rows.empty:
+            user_pw = pw_rows.iloc[0]['value']
+            if user_id != "admin": auth_users[user_id] = user_pw
+    return auth_users
+
+def reference_next_user_number(df):
+    user_rows = df[df['key'].str.endswith('_id')]
+    nums = [int(key.split('_')[1]) for key in user_rows['key'] if key.startswith('user_') and len(key.split('_')) == 3]
+    return max(nums) + 1 if nums else 1
+
+# --- ランダムな設定シート ---
+# 番号の抜け・パスワードだけ/IDだけの番号・同じIDを持つ別の番号・admin・同じパスワード行の重複・
+# アカウント以外の行 (_id で終わるものも) を混ぜて行を並べ替える。
+# 同じ user_N_id 行の重複は save_settings が作らないので含めない
+def random_settings(rng):
+    rows = []
+    names = [f"u{k}" for k in range(rng.randrange(1, 8))] + ['admin']
+    for num in rng.sample(range(1, 40), rng.randrange(0, 15)):
+        has_id, has_pw = rng.random() < 0.9, rng.random() < 0.85
+        if has_id: rows.append(['common', f'user_{num}_id', rng.choice(names)])
+        if has_pw:
+            for _ in range(rng.choice((1, 1, 1, 2))): rows.append(['common', f'user_{num}_pw', f"pw{rng.randrange(1000)}"])
+    for uid in names[:3]:
+        rows.append([uid, 'base_wage', str(rng.randrange(900, 2000))])
+        rows.append([uid, 'closing_day', str(rng.choice((0, 15, 25)))])
+    if rng.random() < 0.5: rows.append(['common', 'station_id', 'st1'])
+    rng.shuffle(rows)
+    return pd.DataFrame(rows, columns=SETTING_COLUMNS)
+
+def test_registry_matches_reference():
+    rng = random.Random(0)
+    for _ in range(500):
+        df = random_settings(rng)
+        users = UserRegistry(account_rows(df))
+        assert users.auth == reference_auth_users(df), df
+        assert users.next_user_number() == reference_next_user_number(df), df
+
+# --- GSheets バックエンドの共有台帳 ---
+def _sheets():
+    settings = pd.DataFrame([['common', 'user_1_id', 'alice'], ['common', 'user_1_pw', 'pa'],
+                             ['common', 'user_2_id', 'bob'], ['common', 'user_2_pw', 'pb'],
+                             ['alice', 'base_wage', '1200']], columns=SETTING_COLUMNS)
+    records = pd.DataFrame([{'id': 1, 'user_id': 'alice', 'date_str': '2026-04-01', 'type': 'WORK', 'start_h': 9, 'start_m': 0,
+                             'end_h': 17, 'end_m': 0, 'distance_km': 0, 'pay_amount': 0, 'duration_minutes': 480}], columns=RECORD_COLUMNS)
+    return {'records': records, 'settings': settings}
+
+@pytest.fixture(params=['rows', 'rewrite'])
+def conn(request):
+    conn = MemoryConnection(_sheets())
+    if request.param == 'rewrite': conn.client = None
+    return conn
+
+def _from_sheet(conn):
+    return UserRegistry(account_rows(conn.sheets['settings'])).auth
+
+def test_save_settings_updates_shared_registry(conn):
+    storage = GSheetsStorage(conn)
+    users = storage.user_registry()
+    reads = conn.calls.get('read', 0)
+    storage.save_settings('common', {'user_1_pw': 'new', 'user_3_id': 'carol', 'user_3_pw': 'pc'})
+    # 読み直さずに同じ台帳へ反映している
+    assert storage.user_registry() is users
+    assert conn.calls.get('read', 0) == reads + 1
+    assert users.check('alice', 'new') and not users.check('alice', 'pa')
+    assert users.check('carol', 'pc')
+    assert users.next_user_number() == 4
+    assert users.auth == _from_sheet(conn)
+
+def test_rename_updates_shared_registry(conn):
+    storage = GSheetsStorage(conn)
+    users = storage.user_registry()
+    storage.update_user_id('alice', 'alicia', 'pw2')
+    assert storage.user_registry() is users
+    assert users.check('alicia', 'pw2') and 'alice' not in users
+    assert users.check('bob', 'pb')
+    assert users.auth == _from_sheet(conn)
+
+def test_rename_without_auth_keeps_registry(conn):
+    storage = GSheetsStorage(conn)
+    users = storage.user_registry()
+    storage.update_user_id('alice', 'alicia', 'pw2', with_auth=False)
+    assert users.check('alice', 'pa') and 'alicia' not in users
+    assert users.auth == _from_sheet(conn)
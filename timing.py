@@ -0,0 +1,208 @@
+# --- 再実行ごとの処理時間の計測 ---
+# 処理名ごとに 回数・時間・行数 を1回の再実行ぶん集め、終わったら直近 window 回の履歴に積む。
+# 無効のときは enabled を見てそのまま元の処理を呼ぶだけにする
+import contextvars
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+logger = logging.getLogger("salary.timing")
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+class _NullSpan:
+    rows = 0
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+NULL_SPAN = _NullSpan()
+
+class _Span:
+    def __init__(self, timings, op, rows):
+        self.timings = timings
+        self.op = op
+        self.rows = rows
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.add(self.op, time.perf_counter() - self.started, self.rows)
+        return False
+
+class _Run:
+    __slots__ = ('ops', 'fields', 'started')
+
+    def __init__(self, fields):
+        self.ops = {}
+        self.fields = fields
+        self.started = time.perf_counter()
+
+class RerunTimings:
+    def __init__(self, enabled=False, window=200):
+        self.enabled = enabled
+        self.window = window
+        self.history = {}
+        self.reruns = 0
+        self.lock = threading.Lock()
+        # Streamlit はセッションごとのスレッドでスクリプトを実行するので、実行中の集計はコンテキストごとに持つ。
+        # 別スレッドの処理も contextvars.copy_context() の中で動かせば同じ再実行に数える (シートの並列読み込みなど)
+        self.current = contextvars.ContextVar(f"rerun_timings_{id(self)}", default=None)
+
+    def begin(self, **fields):
+        # st.rerun などで前回の end が呼ばれなかった場合はここで締める
+        if self.current.get() is not None: self.end()
+        if not self.enabled: return
+        self.current.set(_Run(fields))
+
+    def span(self, op, rows=0):
+        if not self.enabled or self.current.get() is None: return NULL_SPAN
+        return _Span(self, op, rows)
+
+    def add(self, op, seconds, rows=0):
+        run = self.current.get()
+        if run is None: return
+        # 読み込みスレッドからも同時に足される
+        with self.lock:
+            entry = run.ops.setdefault(op, [0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += rows
+
+    def timed(self, op):
+        # 関数を計測するデコレータ
+        def deco(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled: return fn(*args, **kwargs)
+                with self.span(op): return fn(*args, **kwargs)
+            return wrapper
+        return deco
+
+    def rerun(self, fields=dict):
+        # 関数の実行をひとつの再実行として計測するデコレータ (fields() を begin に渡す)。
+        # st.fragment の中だけの再実行ではスクリプト先頭の begin / 末尾の end が呼ばれないので、その分を締める。
+        # 通常の再実行の途中で呼ばれたときはそちらに数える
+        def deco(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if self.current.get() is not None: return fn(*args, **kwargs)
+                self.begin(**fields())
+                try: return fn(*args, **kwargs)
+                finally: self.end(fragment=fn.__name__)
+            return wrapper
+        return deco
+
+    def end(self, **fields):
+        run = self.current.get()
+        if run is None: return None
+        self.current.set(None)
+        ops = run.ops
+        total = time.perf_counter() - run.started
+        fields = dict(run.fields, **fields)
+        ops['rerun'] = [1, total, 0]
+        with self.lock:
+            self.reruns += 1
+            for op, (count, seconds, rows) in ops.items():
+                self.history.setdefault(op, deque(maxlen=self.window)).append((count, seconds, rows))
+        line = dict(fields, event="rerun", ms=round(total * 1000, 1),
+                    ops={op: {'n': c, 'ms': round(s * 1000, 1), 'rows': r} for op, (c, s, r) in ops.items() if op != 'rerun'})
+        logger.info(json.dumps(line, ensure_ascii=False))
+        return line
+
+    def summary(self):
+        # 処理名ごとの 1回の再実行あたりの回数・行数の平均と、時間の p50 / p95 (ミリ秒)
+        with self.lock:
+            history = {op: list(samples) for op, samples in self.history.items()}
+        rows = []
+        for op, samples in sorted(history.items()):
+            times = sorted(s for _, s, _ in samples)
+            rows.append({'処理': op, '再実行数': len(samples),
+                         '回数': round(sum(c for c, _, _ in samples) / len(samples), 1),
+                         '行数': round(sum(r for _, _, r in samples) / len(samples)),
+                         'p50 (ms)': round(_percentile(times, 0.5) * 1000, 1),
+                         'p95 (ms)': round(_percentile(times, 0.95) * 1000, 1)})
+        return rows
+
+    def reset(self):
+        with self.lock:
+            self.history.clear()
+            self.reruns = 0
+
+def _percentile(sorted_values, q):
+    # 最近傍順位法
+    if not sorted_values: return 0.0
+    return sorted_values[max(math.ceil(q * len(sorted_values)) - 1, 0)]
+
+# --- シート入出力の計測 ---
+# conn.read / conn.update と行単位の書き込みを、シート名ごとの処理として時間と行数を記録する
+class TimedConnection:
+    def __init__(self, conn, timings):
+        self.conn = conn
+        self.timings = timings
+
+    def read(self, worksheet=None, **kwargs):
+        if not self.timings.enabled: return self.conn.read(worksheet=worksheet, **kwargs)
+        with self.timings.span(f"sheet.read:{worksheet}") as span:
+            df = self.conn.read(worksheet=worksheet, **kwargs)
+            span.rows = len(df)
+        return df
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        if not self.timings.enabled: return self.conn.update(worksheet=worksheet, data=data, **kwargs)
+        with self.timings.span(f"sheet.update:{worksheet}", rows=len(data)):
+            return self.conn.update(worksheet=worksheet, data=data, **kwargs)
+
+    @property
+    def client(self):
+        client = getattr(self.conn, 'client', None)
+        if not hasattr(client, '_select_worksheet'): return client
+        return _TimedClient(client, self.timings)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+class _TimedClient:
+    def __init__(self, client, timings):
+        self.client = client
+        self.timings = timings
+
+    def _select_worksheet(self, worksheet=None, **kwargs):
+        return _TimedWorksheet(self.client._select_worksheet(worksheet=worksheet, **kwargs), worksheet, self.timings)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+class _TimedWorksheet:
+    def __init__(self, ws, name, timings):
+        self.ws = ws
+        self.name = name
+        self.timings = timings
+
+    def col_values(self, col):
+        with self.timings.span(f"sheet.col_values:{self.name}") as span:
+            values = self.ws.col_values(col)
+            span.rows = len(values)
+        return values
+
+    def append_rows(self, values, **kwargs):
+        with self.timings.span(f"sheet.append_rows:{self.name}", rows=len(values)):
+            return self.ws.append_rows(values, **kwargs)
+
+    def batch_update(self, data, **kwargs):
+        with self.timings.span(f"sheet.batch_update:{self.name}", rows=sum(len(item['values']) for item in data)):
+            return self.ws.batch_update(data, **kwargs)
+
+    def delete_rows(self, row, *args, **kwargs):
+        with self.timings.span(f"sheet.delete_rows:{self.name}", rows=1):
+            return self.ws.delete_rows(row, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.ws, name)